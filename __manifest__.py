@@ -19,6 +19,9 @@ Long description of module's purpose
 
     # any module necessary for this one to work correctly
     'depends': ['base', 'sale_management', 'mail'],
+    'external_dependencies': {
+        'python': ['numpy'],
+    },
 
     # always loaded
     'data': [
@@ -26,8 +29,15 @@ Long description of module's purpose
         'data/mail_person_template.xml',
         'data/mail_team_template.xml',
         'data/ir_sequence.xml',
+        'data/ir_cron.xml',
+        'data/ir_actions_server.xml',
         'views/sales_target_views.xml',
         'views/sales_team_target_views.xml',
+        'views/sales_target_profile_views.xml',
+        'views/sales_target_snapshot_views.xml',
+        'views/sales_target_fact_views.xml',
+        'report/sales_target_report_views.xml',
+        'wizard/sales_target_generate_views.xml',
         'views/menu.xml',
     ],
     # only loaded in demonstration mode
@@ -1,22 +1,80 @@
 # -*- coding: utf-8 -*-
-# from odoo import http
+import hashlib
 
+from werkzeug.exceptions import BadRequest
 
-# class SalesTargetOmax(http.Controller):
-#     @http.route('/sales_target_omax/sales_target_omax', auth='public')
-#     def index(self, **kw):
-#         return "Hello, world"
+from odoo import fields, http
+from odoo.http import request
 
-#     @http.route('/sales_target_omax/sales_target_omax/objects', auth='public')
-#     def list(self, **kw):
-#         return http.request.render('sales_target_omax.listing', {
-#             'root': '/sales_target_omax/sales_target_omax',
-#             'objects': http.request.env['sales_target_omax.sales_target_omax'].search([]),
-#         })
+# Target model behind each progress kind
+PROGRESS_MODELS = {
+    'salesperson': 'sales.target',
+    'team': 'sales.team.target',
+}
+PROGRESS_DEFAULT_LIMIT = 80
+PROGRESS_MAX_LIMIT = 500
 
-#     @http.route('/sales_target_omax/sales_target_omax/objects/<model("sales_target_omax.sales_target_omax"):obj>', auth='public')
-#     def object(self, obj, **kw):
-#         return http.request.render('sales_target_omax.object', {
-#             'object': obj
-#         })
 
+class SalesTargetProgress(http.Controller):
+
+    @http.route('/sales_target_omax/progress/<string:kind>', type='http', auth='user',
+                methods=['GET'], readonly=True)
+    def progress(self, kind, user_id=None, team_id=None, company_id=None, state='open',
+                 offset=0, limit=PROGRESS_DEFAULT_LIMIT, **kw):
+        """Paginated target progress, for dashboards and mobile polling.
+
+        Only stored fields are read. The response carries an ``ETag`` built
+        from the count and progress version of the matching targets, so a
+        poll with a matching ``If-None-Match`` costs one grouped query and
+        gets a 304.
+        """
+        if kind not in PROGRESS_MODELS:
+            raise request.not_found()
+        try:
+            offset = max(int(offset), 0)
+            limit = min(max(int(limit), 1), PROGRESS_MAX_LIMIT)
+            user_id = int(user_id) if user_id else None
+            team_id = int(team_id) if team_id else None
+            company_id = int(company_id) if company_id else None
+        except ValueError:
+            raise BadRequest("offset, limit, user_id, team_id and company_id must be integers")
+
+        targets = request.env[PROGRESS_MODELS[kind]]
+        domain = self._get_progress_domain(targets, user_id, team_id, company_id, state)
+        version, count = targets._get_progress_version(domain)
+        etag = hashlib.sha1(repr((
+            request.env.uid, kind, domain, offset, limit, version, count,
+            # theoretical values move every day without a write
+            fields.Date.context_today(targets),
+        )).encode()).hexdigest()
+        headers = [('ETag', f'"{etag}"'), ('Cache-Control', 'private, no-cache')]
+        if request.httprequest.if_none_match.contains(etag):
+            return request.make_response('', headers=headers, status=304)
+
+        return request.make_json_response({
+            'count': count,
+            'offset': offset,
+            'limit': limit,
+            'targets': targets._get_progress(domain, offset=offset, limit=limit),
+        }, headers=headers)
+
+    def _get_progress_domain(self, targets, user_id, team_id, company_id, state):
+        allowed_company_ids = request.env.user.company_ids.ids
+        if company_id:
+            if company_id not in allowed_company_ids:
+                raise request.not_found()
+            allowed_company_ids = [company_id]
+        domain = [('company_id', 'in', [False, *allowed_company_ids])]
+        if state:
+            domain.append(('state', '=', state))
+        if targets._name == 'sales.target':
+            if user_id:
+                domain.append(('salesperson_id', '=', user_id))
+            if team_id:
+                domain.append(('salesperson_id.sale_team_id', '=', team_id))
+        else:
+            if user_id:
+                domain.append(('user_id', '=', user_id))
+            if team_id:
+                domain.append(('team_id', '=', team_id))
+        return domain
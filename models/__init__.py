@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 
+from . import sales_target_profiler
+from . import sales_target_fact
+from . import sales_target_mixin
+from . import sales_target_achievement_line
+from . import sales_target_recompute_job
+from . import sales_target_snapshot
 from . import sales_person_target
 from . import effective_date
 from . import sales_team_target
@@ -1,103 +1,152 @@
 from odoo import models, fields, api
 
+from .sales_target_profiler import profiled
+
+
 class SaleOrder(models.Model):
     _inherit = "sale.order"
 
     sales_target_id = fields.Many2one(
         'sales.target',
-        string="Sales Target"
+        string="Sales Target",
+        index='btree_not_null'
     )
 
+    @profiled('sale.order.action_confirm (salesperson)')
     def action_confirm(self, *args, **kwargs):
         # Gọi super đúng cách với args/kwargs
         res = super(SaleOrder, self).action_confirm(*args, **kwargs)
 
-        for order in self:
-            # Nếu chưa có sales_team_target_id thì tìm và gán
-            if not order.sales_team_target_id and order.team_id and order.date_order:
-                target = self.env['sales.team.target'].search([
-                    ('team_id', '=', order.team_id.id),
-                    ('state', '=', 'open'),
-                    ('start_date', '<=', order.date_order),
-                    ('end_date', '>=', order.date_order),
-                    ('target_point', '=', 'so_confirm'),
-                ], limit=1)
-                if target:
-                    order.sales_team_target_id = target.id
-
-            # Cập nhật achievement của target
-            if order.sales_team_target_id:
-                order.sales_team_target_id.sudo()._update_achievement(order, 'so_confirm')
+        # Resolve every order against the open targets in one pass; confirming
+        # resets date_order, so the link made on the quotation date is replaced
+        targets = self.env['sales.target'].sudo()
+        matches = targets._find_open_targets(self, 'so_confirm')
+        targets._link_documents(self, 'sales_target_id', matches, overwrite=True)
+        targets._update_achievement(self, 'so_confirm', matches=matches)
+        self.env['sales.target.fact'].sudo()._record_documents(self, 'so_confirm')
+
+        return res
 
+    @profiled('sale.order._action_cancel (salesperson)')
+    def _action_cancel(self):
+        res = super()._action_cancel()
+        self.env['sales.target'].sudo()._reverse_achievement(self, ['so_confirm'])
+        self.env['sales.target.fact'].sudo()._reverse_documents(self, ['so_confirm'])
         return res
 
-    @api.model
-    def create(self, vals):
-
-        order = super(SaleOrder, self).create(vals)
-        
-        salesperson = order.user_id
-        order_date = order.date_order or fields.Datetime.now()
-        
-        if salesperson and order_date:
-            
-            target = self.env["sales.target"].search([
-                ("salesperson_id", "=", salesperson.id),
-                ("start_date", "<=", order_date.date()),
-                ("end_date", ">=", order_date.date()),
-                ("state", "=", "open"),
-                ("target_point", "=", "so_confirm"),
-            ], limit=1)
-            
-            if target:
-                order.sales_target_id = target.id
-        return order 
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = super(SaleOrder, self).create(vals_list)
+
+        targets = self.env["sales.target"].sudo()
+        matches = targets._find_open_targets(orders, 'so_confirm')
+        targets._link_documents(orders, 'sales_target_id', matches, overwrite=True)
+        return orders
 
 class AccountMove(models.Model):
     _inherit = 'account.move'
 
-    sales_target_id = fields.Many2one('sales.target', string="Sales Target")
+    sales_target_id = fields.Many2one('sales.target', string="Sales Target", index='btree_not_null')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._assign_sales_target()
+        return records
 
-    @api.model
-    def create(self, vals):
-        record = super().create(vals)
-        record._assign_sales_target()
-        return record
-    
     def write(self, vals):
+        tracked = any(field in vals for field in ["invoice_user_id", "invoice_date", "company_id"])
+        before = {rec.id: rec._get_sales_target_key() for rec in self} if tracked else {}
         res = super().write(vals)
-        if any(field in vals for field in ["invoice_user_id", "invoice_date", "payment_state"]):
-            for rec in self:
-                rec._assign_sales_target()
+        if tracked:
+            # Chỉ gán lại khi salesperson, ngày hoặc target point thực sự thay đổi
+            self.filtered(lambda rec: rec._get_sales_target_key() != before[rec.id])._assign_sales_target()
         return res
+
+    def _reverse_sales_target_payment(self):
+        """Take back the invoice_paid achievement of invoices no longer paid."""
+        self._assign_sales_target()
+        self.env['sales.target'].sudo()._reverse_achievement(self, ['invoice_paid'])
+        self.env['sales.target.fact'].sudo()._reverse_documents(self, ['invoice_paid'])
+
+    def _get_sales_target_key(self):
+        """Values deciding which sales.target an invoice belongs to."""
+        self.ensure_one()
+        return (self.invoice_user_id.id, self.invoice_date, self.company_id.id)
     
+    def _get_sales_target_documents(self):
+        """Customer invoices and credit notes; other moves never count."""
+        return self.filtered(lambda move: move.move_type in ('out_invoice', 'out_refund'))
+
+    @profiled('account.move.action_post (salesperson)')
     def action_post(self):
         res = super().action_post()
-        for inv in self:
-            self.env['sales.target'].sudo()._update_achievement(inv, 'invoice_validation')
+        # Credit notes are recorded with a negative amount
+        invoices = self._get_sales_target_documents()
+        self.env['sales.target'].sudo()._update_achievement(invoices, 'invoice_validation')
+        self.env['sales.target.fact'].sudo()._record_documents(invoices, 'invoice_validation')
         return res
 
+    @profiled('account.move._reconcile_paid')
     def _reconcile_paid(self):
         res = super()._reconcile_paid()
-        for inv in self:
-            self.env['sales.target'].sudo()._update_achievement(inv, 'invoice_paid')
+        self._get_sales_target_documents()._record_sales_target_payment()
+        return res
+
+    @profiled('account.move._invoice_paid_hook')
+    def _invoice_paid_hook(self):
+        # Called by the reconciliation when invoices become paid; recording
+        # twice is harmless, the ledger keeps one row per invoice and event
+        res = super()._invoice_paid_hook()
+        self._get_sales_target_documents().filtered(
+            lambda move: move.payment_state == 'paid')._record_sales_target_payment()
+        return res
+
+    def _record_sales_target_payment(self):
+        """Add the invoice_paid achievement of invoices that became paid."""
+        self._assign_sales_target()
+        self.env['sales.target'].sudo()._update_achievement(self, 'invoice_paid')
+        self.env['sales.target.fact'].sudo()._record_documents(self, 'invoice_paid')
+
+    @profiled('account.move.button_draft (salesperson)')
+    def button_draft(self):
+        res = super().button_draft()
+        invoices = self._get_sales_target_documents()
+        self.env['sales.target'].sudo()._reverse_achievement(invoices, ['invoice_validation', 'invoice_paid'])
+        self.env['sales.target.fact'].sudo()._reverse_documents(invoices, ['invoice_validation', 'invoice_paid'])
+        return res
+
+    @profiled('account.move.button_cancel (salesperson)')
+    def button_cancel(self):
+        res = super().button_cancel()
+        invoices = self._get_sales_target_documents()
+        self.env['sales.target'].sudo()._reverse_achievement(invoices, ['invoice_validation', 'invoice_paid'])
+        self.env['sales.target.fact'].sudo()._reverse_documents(invoices, ['invoice_validation', 'invoice_paid'])
         return res
     
+    @profiled('_assign_sales_target')
     def _assign_sales_target(self):
-        for inv in self:
-            if not inv.invoice_user_id or not inv.invoice_date:
-                continue
-            if inv.payment_state == "paid":
-                target_point = "invoice_paid"
-            else:
-                target_point = "invoice_validation"
-            target = self.env["sales.target"].search([
-                ("salesperson_id", "=", inv.invoice_user_id.id),
-                ("start_date", "<=", inv.invoice_date),
-                ("end_date", ">=", inv.invoice_date),
-                ("state", "=", "open"),
-                ("target_point", "=", target_point),
-            ], limit=1)
-
-            if target:
-                inv.sales_target_id = target.id           
+        targets = self.env["sales.target"].sudo()
+        invoices = self.filtered(lambda inv: inv.invoice_user_id and inv.invoice_date)
+        # A paid invoice is validated too: it goes to the invoice_paid target
+        # of its salesperson if there is one, else to the invoice_validation one
+        matches = targets._find_open_targets(
+            invoices.filtered(lambda inv: inv.payment_state == "paid"), 'invoice_paid')
+        matches.update(targets._find_open_targets(
+            invoices.filtered(lambda inv: inv.id not in matches), 'invoice_validation'))
+        targets._link_documents(invoices, 'sales_target_id', matches, overwrite=True)
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    def unlink(self):
+        # Unreconciling a payment, or cancelling or resetting it, is what
+        # takes an invoice back from paid: its invoice_paid achievement goes
+        paid = (self.debit_move_id.move_id | self.credit_move_id.move_id)._get_sales_target_documents().filtered(
+            lambda move: move.payment_state == 'paid')
+        res = super().unlink()
+        unpaid = paid.filtered(lambda move: move.payment_state != 'paid')
+        if unpaid:
+            unpaid._reverse_sales_target_payment()
+        return res
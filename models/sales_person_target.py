@@ -1,12 +1,30 @@
 from odoo import models, fields, api
-from datetime import date
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
 
 
 class SalesTarget(models.Model):
     _name = "sales.target"
     _description = "Salesperson Sales Target"
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'sales.target.mixin']
+
+    _target_owner_field = 'salesperson_id'
+    _target_achievement_field = 'achievement_amount'
+    _ledger_target_field = 'sales_target_id'
+    _document_owner_columns = {'sale.order': 'user_id', 'account.move': 'invoice_user_id'}
+    _target_amount_field = 'target_amount'
+    _target_theoretical_field = 'theoretical_amount'
+    _target_percent_field = 'achievement_percent'
+    _target_mail_template = 'sales_target_omax.email_template_sales_target'
+    _target_sequence_code = 'sales.target'
+
+    _sql_constraints = [
+        ('salesperson_period_exclusion',
+         "EXCLUDE USING gist (salesperson_id WITH =, target_point WITH =, dimension WITH =, "
+         "(COALESCE(product_categ_id, 0)) WITH =, (COALESCE(product_id, 0)) WITH =, "
+         "daterange(start_date, end_date, '[]') WITH &&)",
+         "Same Sales Person can't be in same duration for the same Target Point and dimension."),
+    ]
 
     # ======================
     # BASIC INFO
@@ -67,6 +85,22 @@ class SalesTarget(models.Model):
         string="Total Invoices", 
         currency_field="currency_id"
     )
+    order_count = fields.Integer(string="Orders", compute="_compute_document_counts")
+    invoice_count = fields.Integer(string="Invoices", compute="_compute_document_counts")
+
+    achievement_line_ids = fields.One2many(
+        'sales.target.achievement.line', 'sales_target_id',
+        string="Achievement Ledger",
+        readonly=True
+    )
+
+    # Frozen by action_close
+    closed_sale_total = fields.Monetary(string="Final Total Sales", currency_field="currency_id",
+                                        readonly=True, copy=False)
+    closed_invoice_total = fields.Monetary(string="Final Total Invoices", currency_field="currency_id",
+                                           readonly=True, copy=False)
+    closed_order_count = fields.Integer(string="Final Order Count", readonly=True, copy=False)
+    closed_invoice_count = fields.Integer(string="Final Invoice Count", readonly=True, copy=False)
     
     # ======================
     # TARGET INFO
@@ -109,20 +143,20 @@ class SalesTarget(models.Model):
         string="Theoretical Achievement",
         currency_field="currency_id",
         compute="_compute_theoretical",
-        store=False
+        store=True
     )
 
     theoretical_percent = fields.Float(
         string="Theoretical Achievement Percentage",
         compute="_compute_theoretical",
-        store=False
+        store=True
     )
 
     theoretical_status = fields.Selection([
         ('above', "Above Target"),
         ('below', "Below Target"),
         ('completed', "Completed"),
-    ], string="Theoretical Status", compute="_compute_theoretical", store=False)
+    ], string="Theoretical Status", compute="_compute_theoretical", store=True, index=True)
 
     # ======================
     # STATE
@@ -137,57 +171,31 @@ class SalesTarget(models.Model):
     # COMPUTE METHODS
     # ======================
 
-    @api.depends('order_ids.amount_total')
-    def _compute_sale_total(self):
-        for rec in self:
-            rec.sale_total = sum(rec.order_ids.mapped('amount_total'))
-
-    
-    @api.depends("invoice_ids.amount_total")
-    def _compute_invoice_total(self):
-        for rec in self:
-            rec.invoice_total = sum(rec.invoice_ids.mapped("amount_total"))
-    
     @api.depends('target_amount', 'achievement_amount')
     def _compute_difference(self):
         for rec in self:
             rec.difference_amount = rec.target_amount - rec.achievement_amount
             
-    @api.depends('target_point', 'salesperson_id', 'start_date', 'end_date')
-    def _compute_invoice_ids(self):
-        for rec in self:
-            if not (rec.salesperson_id and rec.start_date and rec.end_date):
-                rec.invoice_ids = False
-                continue
-            domain = [
-                ('invoice_user_id', '=', rec.salesperson_id.id),
-                ('invoice_date', '>=', rec.start_date),
-                ('invoice_date', '<=', rec.end_date),
-                ('state', '=', 'posted'),
-            ]
-            if rec.target_point == 'invoice_validation':
-                domain.append(('payment_state', '!=', 'paid'))  # chỉ lấy Not Paid
-            elif rec.target_point == 'invoice_paid':
-                domain.append(('payment_state', '=', 'paid'))   # chỉ lấy Paid
-
-            invoices = self.env['account.move'].search(domain)
-            rec.invoice_ids = invoices
-    @api.depends('target_amount', 'order_ids', 'invoice_ids', 'target_point')
+    @api.depends('target_amount', 'target_point', 'dimension', 'product_categ_id', 'product_id')
     def _compute_achievement(self):
-        """Tính tổng achievement dựa trên target_point"""
-        for rec in self:
-            total = 0
-            if rec.target_point == 'so_confirm':
-                total = rec.sale_total
-            else:
-                total = rec.invoice_total
+        """Tính tổng achievement từ sổ cái achievement
 
+        Product and category targets sum the daily line facts instead.
+        """
+        totals = self._get_ledger_totals()
+        totals.update(self._get_fact_totals())
+        for rec in self:
+            total = totals.get(rec._origin.id, 0)
             rec.achievement_amount = total
             rec.achievement_percent = (total / rec.target_amount * 100) if rec.target_amount else 0
 
+    @api.depends('target_amount', 'start_date', 'end_date', 'achievement_amount')
     def _compute_theoretical(self):
-        """Tính theoretical achievement theo tiến độ ngày"""
-        today = date.today()
+        """Tính theoretical achievement theo tiến độ ngày
+
+        Stored; :meth:`_cron_refresh_theoretical` moves it forward every day.
+        """
+        today = fields.Date.context_today(self)
         for rec in self:
             rec.theoretical_amount = 0
             rec.theoretical_percent = 0
@@ -213,21 +221,6 @@ class SalesTarget(models.Model):
     # ======================
     # CONSTRAINTS
     # ======================
-    @api.constrains('salesperson_id', 'start_date', 'end_date', 'target_point')
-    def _check_unique_sales_target(self):
-        for record in self:
-            # Tìm target khác cùng salesperson + target_point và thời gian overlap
-            overlapping = self.search([
-                ('id', '!=', record.id),
-                ('salesperson_id', '=', record.salesperson_id.id),
-                ('target_point', '=', record.target_point),
-                ('start_date', '<=', record.end_date),
-                ('end_date', '>=', record.start_date),
-            ])
-            if overlapping:
-                raise ValidationError(
-                    "Same Sales Person can't be in same duration for %s" % dict(self._fields['target_point'].selection).get(record.target_point)
-                )
     @api.constrains('target_amount')
     def _check_target_amount(self):
         for record in self:
@@ -237,60 +230,73 @@ class SalesTarget(models.Model):
     # ======================
     # ACTION METHODS
     # ======================
-    def _update_achievement(self, record, point_type):
-        """Cập nhật achievement khi có Sale Order hoặc Invoice."""
-        # Lấy ngày, người phụ trách và số tiền
-        date_field = getattr(record, 'date_order', getattr(record, 'invoice_date', False))
-        user_field = getattr(record, 'user_id', getattr(record, 'invoice_user_id', False))
-        amount = getattr(record, 'amount_total', 0)
-
-        if not date_field or not user_field:
-            return
-
-        # Tìm các sales.target phù hợp
-        targets = self.search([
-            ('salesperson_id', '=', user_field.id),
-            ('target_point', '=', point_type),
-            ('start_date', '<=', date_field),
-            ('end_date', '>=', date_field),
-            ('state', '=', 'open')
-        ])
-
-        # Cập nhật achievement
-        for target in targets:
-            new_amount = target.achievement_amount + amount
-            target.write({
-                'achievement_amount': new_amount,
-                'difference_amount': target.target_amount - new_amount,
-                'achievement_percent': (new_amount / target.target_amount * 100) if target.target_amount else 0,
-            })
-
-    @api.depends('target_point', 'salesperson_id', 'start_date', 'end_date')
+    @api.model
+    def _get_document_owner(self, document):
+        if document._name == 'sale.order':
+            return document.user_id
+        return document.invoice_user_id
+
+    @api.model
+    def _get_theoretical_sql_vals(self, today, achievement):
+        """Same as :meth:`_compute_theoretical`, as SQL assignments."""
+        in_period = SQL(
+            "(COALESCE(t.target_amount, 0) != 0 AND %s::date BETWEEN t.start_date AND t.end_date)", today)
+        total_days = SQL("(t.end_date - t.start_date + 1)")
+        current_day = SQL("(%s::date - t.start_date + 1)", today)
+        theoretical = SQL(
+            "CASE WHEN %s THEN t.target_amount / %s * %s ELSE 0 END", in_period, total_days, current_day)
+        return {
+            'theoretical_amount': theoretical,
+            'theoretical_percent': SQL(
+                "CASE WHEN %s THEN %s * 100.0 / %s ELSE 0 END", in_period, current_day, total_days),
+            'theoretical_status': SQL(
+                "CASE WHEN NOT %s THEN 'completed' WHEN (%s) > %s THEN 'above' ELSE 'below' END",
+                in_period, achievement, theoretical),
+        }
+
+    @api.model
+    def _get_achievement_sql_vals(self, amount):
+        return {
+            'difference_amount': SQL("COALESCE(t.target_amount, 0) - (%s)", amount),
+            'achievement_percent': SQL(
+                "CASE WHEN COALESCE(t.target_amount, 0) != 0 THEN (%s) * 100 / t.target_amount ELSE 0 END",
+                amount),
+        }
+
+    def _add_achievement(self, amounts):
+        result = super()._add_achievement(amounts)
+        # Flow the increments up to the team targets rolled up from their
+        # members; closed targets were left unchanged and add nothing
+        applied = {target_id: amounts[target_id] for target_id in result}
+        self.env['sales.team.target'].sudo()._rollup_member_increments(self.browse(list(applied)), applied)
+        return result
+
+    def _set_achievement(self, amounts):
+        result = super()._set_achievement(amounts)
+        self.env['sales.team.target'].sudo()._refresh_member_rollup(list(amounts))
+        return result
+
+    @api.depends('target_point', 'salesperson_id', 'start_date', 'end_date', 'state')
     def _compute_sale_orders(self):
         """Filter Sale Orders theo thời gian và salesperson"""
+        closed = self.filtered(lambda rec: rec.state == 'closed')
+        orders = self._browse_document_ids(
+            'sale.order', (self - closed)._get_sale_aggregates(SQL("ARRAY_AGG(d.id ORDER BY d.id)")))
+        orders.update(closed._get_linked_documents('sale.order'))
         for rec in self:
-            if not (rec.salesperson_id and rec.start_date and rec.end_date):
-                rec.order_ids = False
-                continue
-
-            rec.order_ids = self.env['sale.order'].search([
-                ('user_id', '=', rec.salesperson_id.id),
-                ('date_order', '>=', rec.start_date),
-                ('date_order', '<=', rec.end_date),
-                ('state', 'in', ['sale', 'done'])
-            ])
-            return rec.order_ids
+            rec.order_ids = orders.get(rec.id, False)
 
     def action_confirm(self):
-
-        for record in self:
-            record.name = self.env['ir.sequence'].next_by_code('sales.target') or "New"
-            record.state = 'open'
-
-    def action_close(self): 
-
-        for record in self:
-            record.state = 'closed'
+        # References come from one sequence reservation per company
+        unnamed = self.filtered(lambda rec: not rec.name or rec.name == "New")
+        for company, records in unnamed.grouped('company_id').items():
+            for record, name in zip(records, self._reserve_names(len(records), company)):
+                record.name = name
+        self.write({'state': 'open'})
+
+    def action_close(self):
+        self._freeze()
+        self.write({'state': 'closed'})
 
     def action_send_mail(self):
         self.ensure_one()
@@ -0,0 +1,221 @@
+import threading
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from odoo.tools.sql import create_index
+
+from .sales_target_profiler import count_rows
+
+
+class SalesTargetAchievementLine(models.Model):
+    _name = "sales.target.achievement.line"
+    _description = "Sales Target Achievement Ledger"
+    _order = "date desc, id desc"
+
+    sales_target_id = fields.Many2one(
+        'sales.target', string="Salesperson Target", index=True, ondelete='cascade')
+    sales_team_target_id = fields.Many2one(
+        'sales.team.target', string="Sales Team Target", index=True, ondelete='cascade')
+
+    res_model = fields.Char(string="Source Model", required=True)
+    res_id = fields.Many2oneReference(string="Source Document", model_field='res_model', required=True)
+    event = fields.Selection([
+        ('so_confirm', 'Sale Order Confirm'),
+        ('invoice_validation', 'Invoice Validation'),
+        ('invoice_paid', 'Invoice Paid'),
+        ('adjustment', 'Recompute Adjustment'),
+        ('reversal', 'Reversal'),
+    ], string="Event", required=True)
+    reversed = fields.Boolean(
+        string="Reversed", readonly=True,
+        help="Cancelled by a reversal row; the document may be counted again afterwards.")
+    pending = fields.Boolean(
+        string="Pending", readonly=True,
+        help="Recorded in deferred mode and not yet applied to the target achievement.")
+    reversed_line_id = fields.Many2one(
+        'sales.target.achievement.line', string="Reversed Line", readonly=True, ondelete='set null')
+
+    date = fields.Date(string="Date")
+    amount = fields.Monetary(string="Amount", currency_field="currency_id")
+    currency_id = fields.Many2one('res.currency', string="Currency")
+    company_id = fields.Many2one('res.company', string="Company")
+
+    def init(self):
+        # One live row per (target, source document, event) makes recording
+        # idempotent; adjustments, reversals and reversed rows may repeat
+        for column in ('sales_target_id', 'sales_team_target_id'):
+            for old_suffix in ('uniq', 'event_uniq'):
+                self.env.cr.execute(SQL(
+                    "DROP INDEX IF EXISTS %s", SQL.identifier(f"{self._table}_{column}_{old_suffix}"),
+                ))
+            self.env.cr.execute(SQL(
+                """
+                CREATE UNIQUE INDEX IF NOT EXISTS %(index)s
+                    ON %(table)s (%(column)s, res_model, res_id, event)
+                 WHERE %(column)s IS NOT NULL
+                   AND event NOT IN ('adjustment', 'reversal')
+                   AND reversed IS NOT TRUE
+                """,
+                index=SQL.identifier(f"{self._table}_{column}_live_uniq"),
+                table=SQL.identifier(self._table),
+                column=SQL.identifier(column),
+            ))
+        # The deferred queue: only the few rows not applied yet
+        create_index(self.env.cr, f"{self._table}_pending_idx", self._table, ['id'], where='pending IS TRUE')
+
+    @api.model
+    def _record(self, target_field, entries, pending=False):
+        """Insert ledger rows, skipping the ones already recorded.
+
+        ``entries`` is a list of ``(target, document, event, amount, date)``.
+        Rows inserted as ``pending`` are applied later by :meth:`_cron_apply_pending`.
+        Returns ``{target id: amount}`` for the rows actually inserted.
+        """
+        if not entries:
+            return {}
+        values = SQL(", ").join(
+            SQL(
+                "(%s, %s, %s, %s, %s, %s::date, %s, %s, %s, %s, %s,"
+                " now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC')",
+                target.id, document._name, document.id, event, amount, date,
+                target.currency_id.id, document.company_id.id, pending,
+                self.env.uid, self.env.uid,
+            )
+            for target, document, event, amount, date in entries
+        )
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO %(table)s (%(target)s, res_model, res_id, event, amount, date,
+                                   currency_id, company_id, pending,
+                                   create_uid, write_uid, create_date, write_date)
+            VALUES %(values)s
+            ON CONFLICT DO NOTHING
+            RETURNING %(target)s, amount
+            """,
+            table=SQL.identifier(self._table),
+            target=SQL.identifier(target_field),
+            values=values,
+        ))
+        rows = self.env.cr.fetchall()
+        count_rows(len(rows))
+        amounts = {}
+        for target_id, amount in rows:
+            amounts[target_id] = amounts.get(target_id, 0.0) + amount
+        return amounts
+
+    @api.model
+    def _reverse(self, target_field, documents, events, date, pending=False):
+        """Reverse the live rows of ``documents`` for ``events``.
+
+        Each row is flagged as reversed and balanced by a negative
+        ``reversal`` row, in one statement; rows already reversed are left
+        alone, so reversing twice has no effect. The documents may then be
+        recorded again (e.g. an order confirmed again after a cancel).
+        Rows of targets that are not open are frozen and left alone.
+        Returns ``{target id: amount}`` of the reversal rows inserted.
+        """
+        if not documents:
+            return {}
+        targets = self.env[self._fields[target_field].comodel_name]
+        self.flush_model()
+        targets.flush_model(['state'])
+        self.env.cr.execute(SQL(
+            """
+            WITH reversed AS (
+                UPDATE %(table)s l
+                   SET reversed = TRUE, write_uid = %(uid)s, write_date = now() AT TIME ZONE 'UTC'
+                  FROM %(target_table)s t
+                 WHERE t.id = l.%(target)s
+                   AND t.state = 'open'
+                   AND l.res_model = %(res_model)s
+                   AND l.res_id IN %(res_ids)s
+                   AND l.event IN %(events)s
+                   AND l.reversed IS NOT TRUE
+             RETURNING l.id, l.%(target)s, l.res_id, l.amount, l.currency_id, l.company_id
+            )
+            INSERT INTO %(table)s (%(target)s, res_model, res_id, event, amount, date,
+                                   currency_id, company_id, reversed_line_id, pending,
+                                   create_uid, write_uid, create_date, write_date)
+            SELECT %(target)s, %(res_model)s, res_id, 'reversal', -amount, %(date)s::date,
+                   currency_id, company_id, id, %(pending)s,
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM reversed
+            RETURNING %(target)s, amount
+            """,
+            table=SQL.identifier(self._table),
+            target=SQL.identifier(target_field),
+            target_table=SQL.identifier(targets._table),
+            res_model=documents._name,
+            res_ids=tuple(documents.ids),
+            events=tuple(events),
+            date=date,
+            pending=pending,
+            uid=self.env.uid,
+        ))
+        rows = self.env.cr.fetchall()
+        # Every reversal row inserted also flagged the row it balances
+        count_rows(2 * len(rows))
+        amounts = {}
+        for target_id, amount in rows:
+            amounts[target_id] = amounts.get(target_id, 0.0) + amount
+        self.invalidate_model(['reversed', 'write_uid', 'write_date'])
+        return amounts
+
+    @api.model
+    def _take_pending(self, target_field, target_ids=None, limit=None, skip_locked=False):
+        """Mark pending rows as applied and return their ``{target id: amount}``.
+
+        Restricted to ``target_ids`` when given. With ``skip_locked``, rows
+        being taken by another transaction are left to it instead of waited for.
+        """
+        if target_ids is not None and not target_ids:
+            return {}
+        self.flush_model()
+        target = SQL.identifier(target_field)
+        self.env.cr.execute(SQL(
+            """
+            WITH taken AS (
+                SELECT id
+                  FROM %(table)s
+                 WHERE pending IS TRUE AND %(target)s IS NOT NULL %(restrict)s
+                 ORDER BY id
+                 %(limit)s
+                   FOR UPDATE %(skip_locked)s
+            )
+            UPDATE %(table)s l
+               SET pending = FALSE
+              FROM taken
+             WHERE l.id = taken.id
+         RETURNING l.%(target)s, l.amount
+            """,
+            table=SQL.identifier(self._table),
+            target=target,
+            restrict=SQL("AND %s IN %s", target, tuple(target_ids)) if target_ids else SQL(),
+            limit=SQL("LIMIT %s", limit) if limit else SQL(),
+            skip_locked=SQL("SKIP LOCKED") if skip_locked else SQL(),
+        ))
+        rows = self.env.cr.fetchall()
+        count_rows(len(rows))
+        amounts = {}
+        for target_id, amount in rows:
+            amounts[target_id] = amounts.get(target_id, 0.0) + amount
+        self.invalidate_model(['pending'])
+        return amounts
+
+    @api.model
+    def _cron_apply_pending(self, batch_size=5000):
+        """Drain the deferred rows, one coalesced increment per target and batch.
+
+        Only this job locks the target rows in deferred mode, so confirmations
+        never wait on each other. Each batch is committed on its own.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for model_name, target_field in (('sales.target', 'sales_target_id'),
+                                         ('sales.team.target', 'sales_team_target_id')):
+            while True:
+                amounts = self._take_pending(target_field, limit=batch_size, skip_locked=True)
+                if not amounts:
+                    break
+                self.env[model_name].sudo()._add_achievement(amounts)
+                if auto_commit:
+                    self.env.cr.commit()
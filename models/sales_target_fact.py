@@ -0,0 +1,253 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+from odoo.tools.sql import create_index
+
+from .sales_target_profiler import count_rows
+
+TARGET_POINTS = [
+    ('so_confirm', 'Sale Order Confirm'),
+    ('invoice_validation', 'Invoice Validation'),
+    ('invoice_paid', 'Invoice Paid'),
+]
+# Columns of a fact, in the order of the upsert conflict target
+FACT_COLUMNS = ('target_point', 'date', 'salesperson_id', 'team_id', 'categ_id', 'product_id',
+                'company_id', 'currency_id')
+
+
+class SalesTargetFact(models.Model):
+    _name = "sales.target.fact"
+    _description = "Sales Target Daily Line Facts"
+    _order = "date desc, id desc"
+    _rec_name = "date"
+
+    date = fields.Date(string="Date", required=True, readonly=True)
+    target_point = fields.Selection(TARGET_POINTS, string="Target Point", required=True, readonly=True)
+    salesperson_id = fields.Many2one('res.users', string="Salesperson", readonly=True)
+    team_id = fields.Many2one('crm.team', string="Sales Team", readonly=True)
+    categ_id = fields.Many2one('product.category', string="Product Category", required=True, readonly=True)
+    product_id = fields.Many2one('product.product', string="Product", required=True, readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", required=True, readonly=True)
+    amount = fields.Monetary(
+        string="Amount", currency_field="currency_id", readonly=True,
+        help="Untaxed line amounts of the day, credit notes counted negatively.")
+
+    def init(self):
+        # Conflict target of the upserts: one row per day and dimension
+        self.env.cr.execute(SQL(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS %(index)s
+                ON %(table)s (target_point, date, COALESCE(salesperson_id, 0), COALESCE(team_id, 0),
+                              categ_id, product_id, company_id, currency_id)
+            """,
+            index=SQL.identifier(f"{self._table}_key_uniq"),
+            table=SQL.identifier(self._table),
+        ))
+        # Dimensional achievement is a range sum over these
+        for owner in ('salesperson_id', 'team_id'):
+            create_index(
+                self.env.cr, f"{self._table}_{owner}_lookup_idx", self._table,
+                [owner, 'target_point', 'date', 'categ_id', 'product_id'],
+                where=f"{owner} IS NOT NULL",
+            )
+
+    @api.model
+    def _get_line_select(self, model_name, target_point, condition):
+        """``SELECT`` of the fact entries of the documents ``d`` matching
+        ``condition``, one per document and product."""
+        if model_name == 'sale.order':
+            return SQL(
+                """
+                SELECT d.id AS res_id, d.date_order::date AS date, d.user_id AS salesperson_id,
+                       d.team_id, pt.categ_id, l.product_id, d.company_id, d.currency_id,
+                       SUM(l.price_subtotal) AS amount
+                  FROM sale_order d
+                  JOIN sale_order_line l ON l.order_id = d.id AND l.display_type IS NULL
+                  JOIN product_product pp ON pp.id = l.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE d.state IN ('sale', 'done') AND %(condition)s
+                 GROUP BY d.id, pt.categ_id, l.product_id
+                """,
+                condition=condition,
+            )
+        return SQL(
+            """
+            SELECT d.id AS res_id, d.invoice_date AS date, d.invoice_user_id AS salesperson_id,
+                   d.team_id, pt.categ_id, l.product_id, d.company_id, d.currency_id,
+                   SUM(CASE WHEN d.move_type = 'out_refund' THEN -l.price_subtotal
+                            ELSE l.price_subtotal END) AS amount
+              FROM account_move d
+              JOIN account_move_line l ON l.move_id = d.id AND l.display_type = 'product'
+              JOIN product_product pp ON pp.id = l.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE d.move_type IN ('out_invoice', 'out_refund')
+               AND d.state = 'posted'
+               AND d.invoice_date IS NOT NULL
+               AND %(paid)s
+               AND %(condition)s
+             GROUP BY d.id, pt.categ_id, l.product_id
+            """,
+            paid=SQL("d.payment_state = 'paid'") if target_point == 'invoice_paid' else SQL("TRUE"),
+            condition=condition,
+        )
+
+    @api.model
+    def _get_entry_insert(self, model_name, target_point, condition, on_conflict=SQL()):
+        """``INSERT`` of the fact entries of the documents matching ``condition``,
+        returning the fact columns and amounts."""
+        entries = self.env['sales.target.fact.entry']
+        return SQL(
+            """
+            INSERT INTO %(table)s (res_model, res_id, target_point, date, salesperson_id, team_id,
+                                   categ_id, product_id, company_id, currency_id, amount,
+                                   create_uid, write_uid, create_date, write_date)
+            SELECT %(res_model)s, s.res_id, %(target_point)s, s.date, s.salesperson_id, s.team_id,
+                   s.categ_id, s.product_id, s.company_id, s.currency_id, s.amount,
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM (%(select)s) s
+            %(on_conflict)s
+            RETURNING %(columns)s, amount
+            """,
+            table=SQL.identifier(entries._table),
+            res_model=model_name,
+            target_point=target_point,
+            uid=self.env.uid,
+            select=self._get_line_select(model_name, target_point, condition),
+            on_conflict=on_conflict,
+            columns=SQL(", ").join(SQL.identifier(column) for column in FACT_COLUMNS),
+        )
+
+    @api.model
+    def _merge(self, changed):
+        """Add the rows of the ``changed`` data-modifying query to the facts.
+
+        ``changed`` returns entries with the fact columns and ``amount``; they
+        are summed per fact and upserted in the same statement. Returns the
+        summed rows, as ``(*FACT_COLUMNS, amount)`` tuples.
+        """
+        columns = SQL(", ").join(SQL.identifier(column) for column in FACT_COLUMNS)
+        self.env.cr.execute(SQL(
+            """
+            WITH changed AS (%(changed)s),
+            summed AS (
+                SELECT %(columns)s, SUM(amount) AS amount
+                  FROM changed
+                 GROUP BY %(columns)s
+            ),
+            upserted AS (
+                INSERT INTO %(table)s (%(columns)s, amount, create_uid, write_uid, create_date, write_date)
+                SELECT %(columns)s, amount, %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+                  FROM summed
+                ON CONFLICT (target_point, date, COALESCE(salesperson_id, 0), COALESCE(team_id, 0),
+                             categ_id, product_id, company_id, currency_id)
+                DO UPDATE SET amount = %(table)s.amount + EXCLUDED.amount,
+                              write_uid = EXCLUDED.write_uid,
+                              write_date = EXCLUDED.write_date
+            )
+            SELECT %(columns)s, amount FROM summed
+            """,
+            changed=changed,
+            columns=columns,
+            table=SQL.identifier(self._table),
+            uid=self.env.uid,
+        ))
+        rows = self.env.cr.fetchall()
+        count_rows(len(rows))
+        self.invalidate_model()
+        self.env['sales.target.fact.entry'].invalidate_model()
+        return rows
+
+    @api.model
+    def _record_documents(self, documents, target_point):
+        """Add the lines of ``documents`` to the facts for ``target_point``.
+
+        The contribution of each document is kept as entries, once per
+        document and point, so replaying an event adds nothing and a reversal
+        takes back exactly what was added. The product and category targets
+        concerned are incremented with the new amounts.
+        """
+        if not documents:
+            return
+        documents.flush_recordset()
+        self.env[f"{documents._name}.line"].flush_model()
+        self._apply_to_targets(self._merge(self._get_entry_insert(
+            documents._name, target_point, SQL("d.id IN %s", tuple(documents.ids)),
+            on_conflict=SQL("ON CONFLICT (res_model, res_id, target_point, product_id) DO NOTHING"),
+        )))
+
+    @api.model
+    def _reverse_documents(self, documents, target_points):
+        """Take back what ``documents`` added to the facts for ``target_points``."""
+        if not documents:
+            return
+        entries = self.env['sales.target.fact.entry']
+        entries.flush_model()
+        changed = SQL(
+            """
+            DELETE FROM %(table)s
+             WHERE res_model = %(res_model)s AND res_id IN %(res_ids)s AND target_point IN %(points)s
+         RETURNING %(columns)s, -amount AS amount
+            """,
+            table=SQL.identifier(entries._table),
+            res_model=documents._name,
+            res_ids=tuple(documents.ids),
+            points=tuple(target_points),
+            columns=SQL(", ").join(SQL.identifier(column) for column in FACT_COLUMNS),
+        )
+        self._apply_to_targets(self._merge(changed))
+
+    @api.model
+    def _apply_to_targets(self, rows):
+        for model_name in ('sales.target', 'sales.team.target'):
+            self.env[model_name].sudo()._add_fact_achievement(rows)
+
+    @api.model
+    def _rebuild(self):
+        """Rebuild entries and facts from the current orders and invoices.
+
+        For the initial load or after a data fix; the product and category
+        targets are recomputed from the new facts, or from their members for
+        the rolled up team targets.
+        """
+        self.env.flush_all()
+        entries = self.env['sales.target.fact.entry']
+        self.env.cr.execute(SQL("TRUNCATE %s, %s", SQL.identifier(entries._table), SQL.identifier(self._table)))
+        # Targets are reset below rather than incremented
+        for model_name, target_point in (('sale.order', 'so_confirm'),
+                                         ('account.move', 'invoice_validation'),
+                                         ('account.move', 'invoice_paid')):
+            self._merge(self._get_entry_insert(model_name, target_point, SQL("TRUE")))
+        for model_name in ('sales.target', 'sales.team.target'):
+            targets = self.env[model_name].sudo().search([('state', '=', 'open'), ('dimension', '!=', 'none')])
+            targets._rebuild_achievement()
+
+
+class SalesTargetFactEntry(models.Model):
+    _name = "sales.target.fact.entry"
+    _description = "Sales Target Fact Entry"
+    _order = "id desc"
+
+    res_model = fields.Char(string="Source Model", required=True, readonly=True)
+    res_id = fields.Many2oneReference(string="Source Document", model_field='res_model',
+                                      required=True, readonly=True)
+    target_point = fields.Selection(TARGET_POINTS, string="Target Point", required=True, readonly=True)
+    date = fields.Date(string="Date", required=True, readonly=True)
+    salesperson_id = fields.Many2one('res.users', string="Salesperson", readonly=True)
+    team_id = fields.Many2one('crm.team', string="Sales Team", readonly=True)
+    categ_id = fields.Many2one('product.category', string="Product Category", required=True, readonly=True)
+    product_id = fields.Many2one('product.product', string="Product", required=True, readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", required=True, readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", required=True, readonly=True)
+    amount = fields.Monetary(string="Amount", currency_field="currency_id", readonly=True)
+
+    def init(self):
+        # One contribution per document, point and product; also the
+        # lookup of the reversals
+        self.env.cr.execute(SQL(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS %(index)s
+                ON %(table)s (res_model, res_id, target_point, product_id)
+            """,
+            index=SQL.identifier(f"{self._table}_document_uniq"),
+            table=SQL.identifier(self._table),
+        ))
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Batched end-of-period forecasts of cumulative achievements. Every function
+# works on a whole batch of targets at once: row ``i`` of a matrix is one
+# target and column ``j`` day ``j - 1`` of its period, so column 0 is the day
+# before the start, when every achievement is still 0.
+
+# z-score of the two-sided confidence band (80%)
+CONFIDENCE_Z = 1.2816
+# Span in days of the exponentially weighted run rate
+EWMA_SPAN = 7
+
+
+def interpolate(values, observed):
+    """Fill the days between observations linearly; days after the last
+    observation are NaN. Column 0 must be observed."""
+    count, width = values.shape
+    columns = np.arange(width)
+    rows = np.arange(count)[:, None]
+    previous = np.maximum.accumulate(np.where(observed, columns, 0), axis=1)
+    following = np.minimum.accumulate(np.where(observed, columns, width)[:, ::-1], axis=1)[:, ::-1]
+    has_following = following < width
+    following = np.minimum(following, width - 1)
+    span = following - previous
+    fraction = np.where(span > 0, (columns - previous) / np.where(span > 0, span, 1), 0.0)
+    filled = values[rows, previous] + (values[rows, following] - values[rows, previous]) * fraction
+    return np.where(has_following, filled, np.nan)
+
+
+def forecast_trend(values, observed, end_columns):
+    """Least-squares line through the observed cumulative values of each
+    row, evaluated at ``end_columns``.
+
+    Returns ``(forecast, standard error)`` of the prediction.
+    """
+    weights = observed.astype(float)
+    x = np.broadcast_to(np.arange(values.shape[1], dtype=float), values.shape)
+    y = np.where(observed, values, 0.0)
+    count = weights.sum(axis=1)
+    x_mean = (weights * x).sum(axis=1) / count
+    y_mean = (weights * y).sum(axis=1) / count
+    dx = (x - x_mean[:, None]) * weights
+    sxx = (dx * dx).sum(axis=1)
+    slope = np.divide((dx * (y - y_mean[:, None])).sum(axis=1), sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    residuals = (y - y_mean[:, None] - slope[:, None] * (x - x_mean[:, None])) * weights
+    variance = (residuals * residuals).sum(axis=1) / np.maximum(count - 2, 1)
+    forecast = y_mean + slope * (end_columns - x_mean)
+    leverage = np.divide((end_columns - x_mean) ** 2, sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    error = np.sqrt(variance * (1 + 1 / count + leverage))
+    return forecast, error
+
+
+def forecast_ewma(values, observed, current, remaining, span=EWMA_SPAN):
+    """Current value plus the exponentially weighted daily run rate over the
+    remaining days.
+
+    Returns ``(forecast, standard error)``; the error of the remaining days
+    adds up as independent daily variations.
+    """
+    increments = np.diff(interpolate(values, observed), axis=1)
+    alpha = 2 / (span + 1)
+    count = values.shape[0]
+    mean = np.zeros(count)
+    variance = np.zeros(count)
+    seen = np.zeros(count, dtype=bool)
+    for day in range(increments.shape[1]):
+        increment = increments[:, day]
+        valid = ~np.isnan(increment)
+        if not valid.any():
+            break
+        increment = np.where(valid, increment, 0.0)
+        delta = increment - mean
+        variance = np.where(valid & seen, (1 - alpha) * (variance + alpha * delta * delta), variance)
+        mean = np.where(valid & seen, mean + alpha * delta, np.where(valid, increment, mean))
+        seen |= valid
+    return current + mean * remaining, np.sqrt(variance * remaining)
@@ -0,0 +1,1497 @@
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+from operator import itemgetter
+
+import numpy as np
+import psycopg2
+
+from odoo import models, fields, api, tools
+from odoo.exceptions import AccessError, UserError, ValidationError
+from odoo.tools import SQL, split_every
+from odoo.tools.sql import create_index
+
+from .sales_target_fact import FACT_COLUMNS
+from .sales_target_forecast import CONFIDENCE_Z, forecast_ewma, forecast_trend
+from .sales_target_profiler import count_rows, profiled
+
+_logger = logging.getLogger(__name__)
+
+# Targets rendered and queued per mail.template call
+MAIL_BATCH_SIZE = 200
+# System parameter: when set, achievement events are only queued in the
+# ledger and applied by the "Apply Deferred Achievements" cron
+DEFERRED_PARAM = 'sales_target_omax.deferred_achievement'
+# Targets forecast per NumPy pass of the nightly job
+FORECAST_BATCH_SIZE = 5000
+# Seconds a leaderboard is served from the worker cache at most; other
+# workers see an achievement change after this delay
+LEADERBOARD_TTL = 60
+
+# {(dbname, model, company id, date): (expiry, rows)}
+_leaderboard_cache = {}
+
+
+def _clear_leaderboards(dbname, model_name):
+    for key in list(_leaderboard_cache):
+        if key[:2] == (dbname, model_name):
+            _leaderboard_cache.pop(key, None)
+
+
+class SalesTargetMixin(models.AbstractModel):
+    _name = "sales.target.mixin"
+    _description = "Sales Target Shared Logic"
+
+    # Field of the target pointing to the owner (salesperson or team)
+    _target_owner_field = None
+    # Stored achievement field of the target
+    _target_achievement_field = None
+    # Field of sales.target.achievement.line / sales.target.snapshot and of the
+    # linked sale orders / invoices pointing to the target
+    _ledger_target_field = None
+    # Owner column of the documents counted by the target, per document model
+    _document_owner_columns = None
+    # Stored target amount and theoretical achievement fields of the target
+    _target_amount_field = None
+    _target_theoretical_field = None
+    # Stored achievement percentage field of the target
+    _target_percent_field = None
+    # Code of the ir.sequence giving target references
+    _target_sequence_code = None
+    # XML id of the mail.template sent with the target results
+    _target_mail_template = None
+
+    mail_sent_date = fields.Date(string="Results Sent On", readonly=True, copy=False)
+
+    dimension = fields.Selection([
+        ('none', 'Whole Orders / Invoices'),
+        ('category', 'Product Category'),
+        ('product', 'Product'),
+    ], string="Measured On", default='none', required=True,
+        help="Product Category / Product: achievement is the untaxed amount of the order or "
+             "invoice lines of that category (subcategories included) or product only.")
+    product_categ_id = fields.Many2one('product.category', string="Product Category")
+    product_id = fields.Many2one('product.product', string="Product")
+
+    forecast_method = fields.Selection([
+        ('ewma', 'Run Rate (EWMA)'),
+        ('trend', 'Linear Trend'),
+    ], string="Forecast Method", default='ewma', required=True,
+        help="Run Rate: achievement so far plus the recent daily rate, weighted towards the last "
+             "days, over the remaining days. Linear Trend: straight line fitted on the daily history.")
+    forecast_amount = fields.Monetary(string="Forecast", currency_field="currency_id", readonly=True,
+                                      copy=False, help="Projected achievement at the end date.")
+    forecast_low = fields.Monetary(string="Forecast (Low)", currency_field="currency_id", readonly=True,
+                                   copy=False, help="Lower bound of the 80% confidence band.")
+    forecast_high = fields.Monetary(string="Forecast (High)", currency_field="currency_id", readonly=True,
+                                    copy=False, help="Upper bound of the 80% confidence band.")
+    forecast_percent = fields.Float(string="Forecast Percentage", readonly=True, copy=False)
+    forecast_status = fields.Selection([
+        ('hit', "Projected to Hit"),
+        ('at_risk', "At Risk"),
+        ('miss', "Projected to Miss"),
+    ], string="Forecast Status", readonly=True, copy=False, index=True)
+    forecast_date = fields.Date(string="Forecast On", readonly=True, copy=False)
+
+    # Drawn from a database sequence by every change of the progress values
+    progress_version = fields.Integer(string="Progress Version", readonly=True, copy=False)
+
+    leaderboard_rank = fields.Integer(string="Rank", compute="_compute_leaderboard_rank")
+    leaderboard_gap_rank = fields.Integer(string="Rank vs. Theoretical", compute="_compute_leaderboard_rank")
+
+    def _auto_init(self):
+        if not self._abstract:
+            # The period exclusion constraints need GiST support for scalar columns
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self.env.cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+            except psycopg2.Error:
+                _logger.warning(
+                    "Could not create the btree_gist extension: overlapping %s periods "
+                    "are checked by the ORM instead of the database.", self._name)
+        return super()._auto_init()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._bump_progress_version()
+        self.env.registry.clear_cache()
+        self._invalidate_leaderboard()
+        return records
+
+    def write(self, vals):
+        if not vals.keys().isdisjoint(self._get_frozen_fields()) and any(
+            rec.state == 'closed' for rec in self
+        ):
+            raise ValidationError("Closed targets are frozen: their owner, period, point and amount "
+                                  "cannot be changed.")
+        res = super().write(vals)
+        if not vals.keys().isdisjoint(self._get_progress_fields()):
+            self._bump_progress_version()
+        if not vals.keys().isdisjoint(self._get_open_target_cache_fields()):
+            self.env.registry.clear_cache()
+        if not vals.keys().isdisjoint(self._get_leaderboard_fields()):
+            self._invalidate_leaderboard()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        self._invalidate_leaderboard()
+        return res
+
+    @api.constrains('dimension', 'product_categ_id', 'product_id')
+    def _check_dimension(self):
+        for rec in self:
+            if rec.dimension == 'category' and not rec.product_categ_id:
+                raise ValidationError("Please set the product category measured by the target.")
+            if rec.dimension == 'product' and not rec.product_id:
+                raise ValidationError("Please set the product measured by the target.")
+
+    @api.model
+    def _get_period_exclusion(self):
+        """Key and message of the period exclusion constraint of the model."""
+        return next((key, message) for key, definition, message in self._sql_constraints
+                    if definition.startswith('EXCLUDE'))
+
+    @api.model
+    @tools.ormcache()
+    def _has_period_exclusion(self):
+        """Whether the database enforces the period exclusion constraint;
+        it is missing when the btree_gist extension could not be created."""
+        key, __ = self._get_period_exclusion()
+        self.env.cr.execute(SQL("SELECT 1 FROM pg_constraint WHERE conname = %s", f"{self._table}_{key}"))
+        return bool(self.env.cr.fetchone())
+
+    @api.constrains(lambda self: (self._target_owner_field, 'target_point', 'start_date', 'end_date',
+                                  'dimension', 'product_categ_id', 'product_id'))
+    def _check_period_overlap(self):
+        """Fallback of the period exclusion constraint, with one query for
+        the whole recordset."""
+        if self._has_period_exclusion():
+            return
+        owner = SQL.identifier(self._target_owner_field)
+        self.flush_model([self._target_owner_field, 'target_point', 'start_date', 'end_date',
+                          'dimension', 'product_categ_id', 'product_id'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT t.id
+              FROM %(table)s t
+              JOIN %(table)s o ON o.id != t.id
+                              AND o.%(owner)s = t.%(owner)s
+                              AND o.target_point = t.target_point
+                              AND o.dimension = t.dimension
+                              AND COALESCE(o.product_categ_id, 0) = COALESCE(t.product_categ_id, 0)
+                              AND COALESCE(o.product_id, 0) = COALESCE(t.product_id, 0)
+                              AND daterange(o.start_date, o.end_date, '[]')
+                               && daterange(t.start_date, t.end_date, '[]')
+             WHERE t.id IN %(ids)s
+             LIMIT 1
+            """,
+            table=SQL.identifier(self._table),
+            owner=owner,
+            ids=tuple(self.ids),
+        ))
+        if self.env.cr.fetchone():
+            raise ValidationError(self._get_period_exclusion()[1])
+
+    def init(self):
+        super().init()
+        if self._abstract:
+            return
+        # Covers every "open target of this owner on this date" lookup
+        create_index(
+            self.env.cr, f"{self._table}_open_lookup_idx", self._table,
+            [self._target_owner_field, 'target_point', 'state', 'start_date', 'end_date'],
+        )
+        self.env.cr.execute(SQL(
+            "CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier(self._get_progress_sequence())))
+
+    # ======================
+    # DOCUMENT HELPERS
+    # ======================
+    @api.model
+    def _get_document_owner(self, document):
+        """Return the owner (salesperson or team) of a sale order / invoice."""
+        raise NotImplementedError()
+
+    @api.model
+    def _get_document_date(self, document):
+        if document._name == 'sale.order':
+            return document.date_order and document.date_order.date()
+        return document.invoice_date
+
+    @api.model
+    def _get_document_amount(self, document):
+        """Amount a document adds to achievement: credit notes count negatively."""
+        if document._name == 'account.move' and document.move_type == 'out_refund':
+            return -document.amount_total
+        return document.amount_total
+
+    @api.model
+    def _get_document_amount_sql(self, model_name):
+        """SQL counterpart of :meth:`_get_document_amount` on the document table ``d``."""
+        if model_name == 'account.move':
+            return SQL("CASE WHEN d.move_type = 'out_refund' THEN -d.amount_total ELSE d.amount_total END")
+        return SQL("d.amount_total")
+
+    @api.model
+    def _get_theoretical_sql_vals(self, today, achievement):
+        """SQL assignments of the stored theoretical columns on ``today``.
+
+        ``achievement`` is the SQL expression of the achievement to compare
+        with; expressions refer to the target table as ``t``.
+        """
+        raise NotImplementedError()
+
+    @api.model
+    def _get_achievement_sql_vals(self, amount):
+        """SQL assignments of the columns derived from the achievement.
+
+        ``amount`` is the SQL expression of the new achievement; expressions
+        refer to the target table as ``t``.
+        """
+        raise NotImplementedError()
+
+    # ======================
+    # CURRENCY CONVERSION
+    # ======================
+    @api.model
+    def _get_currency_rates(self, currency_ids, root_company_ids):
+        """Rates of ``currency_ids`` as ``{(currency id, root company id or 0): (dates, rates)}``.
+
+        Every rate of the requested currencies is loaded in one query and
+        memoized on the cursor, so converting any number of amounts in a
+        request costs at most one query per new currency.
+        """
+        cache = self.env.cr.cache.setdefault('sales_target_currency_rates', {})
+        missing = {
+            (currency_id, company_id)
+            for currency_id in currency_ids for company_id in root_company_ids
+            if (currency_id, company_id) not in cache
+        }
+        if missing:
+            rate_model = self.env['res.currency.rate']
+            rate_model.flush_model(['currency_id', 'company_id', 'name', 'rate'])
+            self.env.cr.execute(SQL(
+                """
+                SELECT currency_id, COALESCE(company_id, 0), name, rate
+                  FROM %s
+                 WHERE currency_id IN %s
+                   AND (company_id IN %s OR company_id IS NULL)
+                 ORDER BY name
+                """,
+                SQL.identifier(rate_model._table),
+                tuple({currency_id for currency_id, __ in missing}),
+                tuple({company_id for __, company_id in missing}),
+            ))
+            loaded = defaultdict(lambda: ([], []))
+            for currency_id, company_id, date, rate in self.env.cr.fetchall():
+                dates, rates = loaded[currency_id, company_id]
+                dates.append(date)
+                rates.append(rate)
+            for currency_id, company_id in missing:
+                cache[currency_id, company_id] = loaded.get((currency_id, company_id), ((), ()))
+                cache.setdefault((currency_id, 0), loaded.get((currency_id, 0), ((), ())))
+        return cache
+
+    @api.model
+    def _get_currency_rate(self, rates, currency_id, root_company_id, date):
+        """Rate of a currency on ``date``, picked like :meth:`res.currency._get_rates`:
+        the latest one on or before the date, company rates first, else the
+        oldest one, else 1."""
+        keys = ((currency_id, root_company_id), (currency_id, 0))
+        for key in keys:
+            dates, values = rates[key]
+            index = bisect_right(dates, date)
+            if index:
+                return values[index - 1]
+        for key in keys:
+            if rates[key][1]:
+                return rates[key][1][0]
+        return 1.0
+
+    @api.model
+    def _convert_amount_groups(self, groups):
+        """Convert amounts grouped as ``(amount, from currency id, to currency id, company id, date)``.
+
+        Each group is converted once with the rates of
+        :meth:`_get_currency_rates`, instead of calling
+        :meth:`res.currency._convert` per document. Groups without date use
+        today's rate. Returns the converted amounts, in order.
+        """
+        to_convert = [
+            group for group in groups
+            if group[1] and group[2] and group[1] != group[2]
+        ]
+        if not to_convert:
+            return [amount for amount, *__ in groups]
+        today = fields.Date.context_today(self)
+        companies = self.env['res.company'].browse({group[3] for group in to_convert if group[3]})
+        root_ids = {company.id: company.root_id.id for company in companies}
+        root_ids[False] = root_ids[None] = self.env.company.root_id.id
+        rates = self._get_currency_rates(
+            {currency_id for group in to_convert for currency_id in group[1:3]},
+            set(root_ids.values()),
+        )
+        currencies = self.env['res.currency'].browse({group[2] for group in to_convert})
+        result = []
+        for amount, from_id, to_id, company_id, date in groups:
+            if from_id and to_id and from_id != to_id:
+                root_id = root_ids[company_id]
+                date = date or today
+                amount = currencies.browse(to_id).round(
+                    amount
+                    * self._get_currency_rate(rates, to_id, root_id, date)
+                    / self._get_currency_rate(rates, from_id, root_id, date)
+                )
+            result.append(amount)
+        return result
+
+    # ======================
+    # BATCHED TARGET RESOLUTION
+    # ======================
+    @api.model
+    def _get_open_target_cache_fields(self):
+        """Fields whose change invalidates the cached open target periods."""
+        return {self._target_owner_field, 'target_point', 'state', 'start_date', 'end_date', 'company_id',
+                'dimension'}
+
+    @api.model
+    @tools.ormcache('owner_id', 'target_point', 'company_id')
+    def _get_open_target_intervals(self, owner_id, target_point, company_id):
+        """Open whole-document target periods of one owner as ``((start, end, id), ...)``.
+
+        Product and category targets are fed by the line facts instead.
+        Cached per registry; any change of a target's owner, period, point,
+        company, state or dimension clears the cache in every worker.
+        """
+        self.flush_model(self._get_open_target_cache_fields())
+        self.env.cr.execute(SQL(
+            """
+            SELECT start_date, end_date, id
+              FROM %(table)s
+             WHERE %(owner)s = %(owner_id)s
+               AND target_point = %(target_point)s
+               AND state = 'open'
+               AND dimension = 'none'
+               AND (company_id = %(company_id)s OR company_id IS NULL)
+             ORDER BY start_date, id
+            """,
+            table=SQL.identifier(self._table),
+            owner=SQL.identifier(self._target_owner_field),
+            owner_id=owner_id,
+            target_point=target_point,
+            company_id=company_id,
+        ))
+        return tuple(self.env.cr.fetchall())
+
+    @api.model
+    def _find_open_targets(self, documents, point_type, owners=None):
+        """Match documents to the open target covering their owner and date.
+
+        Target periods come from the registry cache and are matched with an
+        interval lookup, so resolving documents does not query the targets.
+        ``owners`` optionally maps document ids to the owner to use instead
+        of :meth:`_get_document_owner`. Returns ``{document id: target}``.
+        """
+        target_ids = {}
+        for document in documents:
+            owner = owners.get(document.id) if owners is not None else self._get_document_owner(document)
+            document_date = self._get_document_date(document)
+            if not (owner and document_date):
+                continue
+            intervals = self._get_open_target_intervals(owner.id, point_type, document.company_id.id)
+            # Periods of one owner never overlap for a given target point, so the
+            # candidate is the last target starting on or before the document date.
+            index = bisect_right(intervals, document_date, key=itemgetter(0)) - 1
+            if index >= 0 and intervals[index][1] >= document_date:
+                target_ids[document.id] = intervals[index][2]
+        # Matched targets share one prefetch set: reading a field of one loads them all
+        prefetch_ids = tuple(dict.fromkeys(target_ids.values()))
+        return {
+            document_id: self.browse(target_id).with_prefetch(prefetch_ids)
+            for document_id, target_id in target_ids.items()
+        }
+
+    @api.model
+    def _link_documents(self, documents, field_name, matches, overwrite=False):
+        """Set ``field_name`` on documents from ``matches``, one write per target.
+
+        Documents already linked are left alone unless ``overwrite`` is set.
+        """
+        groups = defaultdict(list)
+        for document in documents:
+            target = matches.get(document.id)
+            if target and (overwrite or not document[field_name]) and document[field_name].id != target.id:
+                groups[target.id].append(document.id)
+        for target_id, document_ids in groups.items():
+            documents.browse(document_ids).write({field_name: target_id})
+
+    # ======================
+    # SET-BASED AGGREGATES
+    # ======================
+    def _aggregate_documents(self, model_name, owner_column, date_expr, condition, aggregate=None):
+        """Run one grouped query over the documents of ``model_name`` for the
+        whole recordset, matched on owner and period.
+
+        Each record contributes its owner, period and company as a ``VALUES``
+        row, so unsaved records are supported and no document is loaded in
+        the ORM; a target without company counts the documents of all.
+        Expressions refer to the document table as ``d``.
+        Without ``aggregate``, sums the document amounts (credit notes
+        negatively) in the currency of each target.
+        Returns ``{record id: aggregate}``.
+        """
+        rows = [
+            (rec.id, rec[self._target_owner_field].id, rec.start_date, rec.end_date, rec.currency_id.id,
+             rec.company_id.id)
+            for rec in self
+            if rec[self._target_owner_field] and rec.start_date and rec.end_date
+        ]
+        if not rows:
+            return {}
+        if aggregate is None:
+            # Documents already in the target currency need no rate: they are
+            # summed into a single group per target, the others per day
+            select = SQL(
+                """
+                d.currency_id, d.company_id,
+                CASE WHEN d.currency_id = t.currency_id THEN NULL ELSE %s END,
+                COALESCE(SUM(%s), 0)
+                """,
+                date_expr, self._get_document_amount_sql(model_name),
+            )
+            group_by = SQL("t.key, d.currency_id, d.company_id, 4")
+        else:
+            select, group_by = aggregate, SQL("t.key")
+        documents = self.env[model_name]
+        documents.flush_model()
+        values = SQL(", ").join(
+            SQL("(%s, %s, %s::date, %s::date, %s::int, %s::int)",
+                key, owner_id, start_date, end_date, currency_id, company_id)
+            for key, (__, owner_id, start_date, end_date, currency_id, company_id) in enumerate(rows)
+        )
+        self.env.cr.execute(SQL(
+            """
+            SELECT t.key, %(select)s
+              FROM (VALUES %(values)s) AS t(key, owner_id, start_date, end_date, currency_id, company_id)
+              JOIN %(table)s d ON d.%(owner)s = t.owner_id
+                              AND %(date)s BETWEEN t.start_date AND t.end_date
+                              AND (t.company_id IS NULL OR d.company_id = t.company_id)
+             WHERE %(condition)s
+             GROUP BY %(group_by)s
+            """,
+            select=select,
+            values=values,
+            table=SQL.identifier(documents._table),
+            owner=SQL.identifier(owner_column),
+            date=date_expr,
+            condition=condition,
+            group_by=group_by,
+        ))
+        if aggregate is not None:
+            return {rows[key][0]: value for key, value in self.env.cr.fetchall()}
+        groups = self.env.cr.fetchall()
+        amounts = self._convert_amount_groups([
+            (amount, currency_id, rows[key][4], company_id, date)
+            for key, currency_id, company_id, date, amount in groups
+        ])
+        totals = dict.fromkeys((row[0] for row in rows), 0.0)
+        for (key, *__), amount in zip(groups, amounts):
+            totals[rows[key][0]] += amount
+        return totals
+
+    @api.model
+    def _browse_document_ids(self, model_name, ids_by_record):
+        """Browse aggregated document ids, keeping only those the user may read."""
+        documents = self.env[model_name].browse(
+            {doc_id for doc_ids in ids_by_record.values() for doc_id in doc_ids}
+        )
+        allowed = set(documents._filter_access_rules('read').ids)
+        return {
+            key: documents.browse([doc_id for doc_id in doc_ids if doc_id in allowed])
+            for key, doc_ids in ids_by_record.items()
+        }
+
+    @api.model
+    def _get_invoice_point_condition(self, target_point):
+        """Payment condition on ``account_move d`` for an invoice target point.
+
+        An invoice is validated once posted, paid or not, like the ledger
+        rows recorded on post.
+        """
+        if target_point == 'invoice_paid':
+            return SQL("d.payment_state = 'paid'")
+        return SQL("TRUE")
+
+    def _get_sale_aggregates(self, aggregate=None):
+        """Aggregate the confirmed orders of each owner over the target period."""
+        return self._aggregate_documents(
+            'sale.order', self._document_owner_columns['sale.order'], SQL("d.date_order::date"),
+            SQL("d.state IN ('sale', 'done')"), aggregate,
+        )
+
+    def _get_invoice_aggregates(self, aggregate=None):
+        """Aggregate the posted customer invoices and credit notes of each
+        owner over the target period, one query per target point."""
+        result = {}
+        for target_point, records in self.grouped('target_point').items():
+            result.update(records._aggregate_documents(
+                'account.move', self._document_owner_columns['account.move'], SQL("d.invoice_date"),
+                SQL("d.move_type IN ('out_invoice', 'out_refund') AND d.state = 'posted' AND %s",
+                    self._get_invoice_point_condition(target_point)),
+                aggregate,
+            ))
+        return result
+
+    # ======================
+    # DOCUMENT TOTALS
+    # ======================
+    @api.depends(lambda self: ('target_point', self._target_owner_field, 'start_date', 'end_date', 'state'))
+    def _compute_sale_total(self):
+        closed = self.filtered(lambda rec: rec.state == 'closed')
+        totals = (self - closed)._get_sale_aggregates()
+        for rec in self:
+            rec.sale_total = rec.closed_sale_total if rec in closed else totals.get(rec.id, 0)
+
+    @api.depends(lambda self: ('target_point', self._target_owner_field, 'start_date', 'end_date', 'state'))
+    def _compute_invoice_total(self):
+        closed = self.filtered(lambda rec: rec.state == 'closed')
+        totals = (self - closed)._get_invoice_aggregates()
+        for rec in self:
+            rec.invoice_total = rec.closed_invoice_total if rec in closed else totals.get(rec.id, 0)
+
+    @api.depends(lambda self: ('target_point', self._target_owner_field, 'start_date', 'end_date', 'state'))
+    def _compute_document_counts(self):
+        # One grouped COUNT per document model for the whole recordset
+        closed = self.filtered(lambda rec: rec.state == 'closed')
+        open_targets = self - closed
+        order_counts = open_targets._get_sale_aggregates(SQL("COUNT(d.id)"))
+        invoice_counts = open_targets._get_invoice_aggregates(SQL("COUNT(d.id)"))
+        for rec in self:
+            if rec in closed:
+                rec.order_count = rec.closed_order_count
+                rec.invoice_count = rec.closed_invoice_count
+            else:
+                rec.order_count = order_counts.get(rec.id, 0)
+                rec.invoice_count = invoice_counts.get(rec.id, 0)
+
+    @api.depends(lambda self: ('target_point', self._target_owner_field, 'start_date', 'end_date', 'state'))
+    def _compute_invoice_ids(self):
+        # Closed targets list the invoices linked to them, not the period's history
+        closed = self.filtered(lambda rec: rec.state == 'closed')
+        invoices = self._browse_document_ids(
+            'account.move', (self - closed)._get_invoice_aggregates(SQL("ARRAY_AGG(d.id ORDER BY d.id)")))
+        invoices.update(closed._get_linked_documents('account.move'))
+        for rec in self:
+            rec.invoice_ids = invoices.get(rec.id, False)
+
+    # ======================
+    # ACHIEVEMENT
+    # ======================
+    def _add_achievement(self, amounts):
+        """Atomically add ``{target id: amount}`` to the stored achievements.
+
+        The increment and the derived difference / percentage are computed by
+        the database in a single ``UPDATE``, so concurrent confirmations never
+        lose an update. Rows are locked in id order first, which gives every
+        transaction the same lock order when one event touches several
+        targets. Closed targets are frozen and left unchanged.
+        Returns ``{target id: new achievement}``.
+        """
+        return self._apply_achievement(amounts, increment=True)
+
+    def _set_achievement(self, amounts):
+        """Set ``{target id: amount}`` as the stored achievements, like
+        :meth:`_add_achievement` but with absolute values."""
+        return self._apply_achievement(amounts, increment=False)
+
+    def _apply_achievement(self, amounts, increment):
+        if not amounts:
+            return {}
+        achievement = self._target_achievement_field
+        target_ids = sorted(amounts)
+        targets = self.browse(target_ids)
+        targets.flush_recordset()
+
+        self.env.cr.execute(SQL(
+            "SELECT id FROM %s WHERE id IN %s AND state != 'closed' ORDER BY id FOR NO KEY UPDATE",
+            SQL.identifier(self._table), tuple(target_ids),
+        ))
+        if increment:
+            new_amount = SQL("COALESCE(t.%s, 0) + v.amount", SQL.identifier(achievement))
+        else:
+            new_amount = SQL("v.amount")
+        assignments = {
+            achievement: new_amount,
+            **self._get_achievement_sql_vals(new_amount),
+            **self._get_theoretical_sql_vals(fields.Date.context_today(self), new_amount),
+            'progress_version': self._get_progress_version_sql(),
+        }
+        self.env.cr.execute(SQL(
+            """
+            UPDATE %(table)s t
+               SET %(assignments)s,
+                   write_uid = %(uid)s,
+                   write_date = now() AT TIME ZONE 'UTC'
+              FROM (VALUES %(values)s) AS v(target_id, amount)
+             WHERE t.id = v.target_id AND t.state != 'closed'
+         RETURNING t.id, t.%(achievement)s
+            """,
+            table=SQL.identifier(self._table),
+            assignments=SQL(", ").join(
+                SQL("%s = %s", SQL.identifier(column), value) for column, value in assignments.items()
+            ),
+            uid=self.env.uid,
+            values=SQL(", ").join(
+                SQL("(%s, %s::numeric)", target_id, amounts[target_id]) for target_id in target_ids
+            ),
+            achievement=SQL.identifier(achievement),
+        ))
+        result = dict(self.env.cr.fetchall())
+        count_rows(len(result))
+        targets.invalidate_recordset([*assignments, 'write_uid', 'write_date'])
+        self._invalidate_leaderboard()
+        return result
+
+    @api.model
+    @profiled('_update_achievement')
+    def _update_achievement(self, records, point_type, matches=None):
+        """Update achievements from confirmed sale orders or invoices.
+
+        ``records`` may hold any number of documents; they are resolved against
+        the open targets in one pass. Each (target, document, event) is written
+        to the achievement ledger once, and only newly recorded amounts are
+        added to the targets, so replaying an event does not count it twice.
+        Amounts are recorded in the currency of the target. In deferred mode
+        the rows are only queued, for :meth:`_cron_apply_pending` to apply.
+        """
+        if matches is None:
+            matches = self._find_open_targets(records, point_type)
+        records = records.filtered(lambda record: record.id in matches)
+        if not records:
+            return
+        dates = [self._get_document_date(record) for record in records]
+        converted = self._convert_amount_groups([
+            (self._get_document_amount(record), record.currency_id.id, matches[record.id].currency_id.id,
+             record.company_id.id, date)
+            for record, date in zip(records, dates)
+        ])
+        entries = [
+            (matches[record.id], record, point_type, amount, date)
+            for record, amount, date in zip(records, converted, dates)
+        ]
+        deferred = self._is_achievement_deferred()
+        amounts = self.env['sales.target.achievement.line'].sudo()._record(
+            self._ledger_target_field, entries, pending=deferred)
+        self.invalidate_model(['achievement_line_ids'])
+        if amounts and not deferred:
+            self._add_achievement(amounts)
+
+    @api.model
+    def _is_achievement_deferred(self):
+        return bool(self.env['ir.config_parameter'].sudo().get_param(DEFERRED_PARAM))
+
+    def _apply_pending_achievement(self):
+        """Apply the deferred ledger rows of these targets right away."""
+        amounts = self.env['sales.target.achievement.line'].sudo()._take_pending(
+            self._ledger_target_field, self._origin.ids)
+        if amounts:
+            self._add_achievement(amounts)
+
+    @api.model
+    @profiled('_reverse_achievement')
+    def _reverse_achievement(self, records, events):
+        """Take back what ``records`` added for ``events`` (order cancelled,
+        invoice reset to draft or cancelled).
+
+        The live ledger rows of the documents are reversed and the matching
+        negative amounts are applied to their targets incrementally.
+        """
+        deferred = self._is_achievement_deferred()
+        amounts = self.env['sales.target.achievement.line'].sudo()._reverse(
+            self._ledger_target_field, records, events, fields.Date.context_today(self), pending=deferred)
+        self.invalidate_model(['achievement_line_ids'])
+        if amounts and not deferred:
+            self._add_achievement(amounts)
+
+    def _get_ledger_totals(self):
+        """Sum the ledger rows of each target with one grouped query.
+
+        Deferred rows are left out until applied: the stored achievement
+        does not include them yet, and applying them adds them to it.
+        """
+        groups = self.env['sales.target.achievement.line'].sudo()._read_group(
+            [(self._ledger_target_field, 'in', self._origin.ids), ('pending', '!=', True)],
+            [self._ledger_target_field], ['amount:sum'],
+        )
+        return {target.id: amount for target, amount in groups}
+
+    def _rebuild_achievement(self):
+        """Reset the stored achievements to the sum of their ledger rows."""
+        dimensional = self.filtered(lambda target: target.dimension != 'none')
+        dimensional._set_achievement(dimensional._get_fact_totals())
+        targets = self - dimensional
+        targets._apply_pending_achievement()
+        totals = targets._get_ledger_totals()
+        targets._set_achievement({target.id: totals.get(target.id, 0.0) for target in targets})
+
+    def action_rebuild_achievement(self):
+        self._rebuild_achievement()
+
+    @api.model
+    def _cron_refresh_theoretical(self):
+        """Move the stored theoretical values of every open target to today,
+        in a single ``UPDATE``."""
+        self.flush_model()
+        assignments = {
+            **self._get_theoretical_sql_vals(
+                fields.Date.context_today(self),
+                SQL("t.%s", SQL.identifier(self._target_achievement_field)),
+            ),
+            'progress_version': self._get_progress_version_sql(),
+        }
+        self.env.cr.execute(SQL(
+            "UPDATE %s t SET %s WHERE t.state = 'open'",
+            SQL.identifier(self._table),
+            SQL(", ").join(
+                SQL("%s = %s", SQL.identifier(column), value) for column, value in assignments.items()
+            ),
+        ))
+        self.invalidate_model(list(assignments))
+        self._invalidate_leaderboard()
+
+    # ======================
+    # FULL RECOMPUTE
+    # ======================
+    def _get_source_totals(self):
+        """Achievement of each target recomputed from its source documents."""
+        dimensional = self.filtered(lambda target: target.dimension != 'none')
+        totals = dimensional._get_fact_totals()
+        targets = self - dimensional
+        so_targets = targets.filtered(lambda target: target.target_point == 'so_confirm')
+        totals.update(so_targets._get_sale_aggregates())
+        totals.update((targets - so_targets)._get_invoice_aggregates())
+        return totals
+
+    def _recompute_achievement(self):
+        """Reset achievement, difference and percentage from the source documents.
+
+        Totals come from the set-based aggregates. The gap with the ledger is
+        recorded as one adjustment row per target, so rebuilding from the
+        ledger gives the same result afterwards. Closed targets are frozen
+        and skipped.
+        """
+        targets = self.filtered(lambda target: target.state != 'closed')
+        # Product and category targets have no ledger: the facts are their source
+        dimensional = targets.filtered(lambda target: target.dimension != 'none')
+        dimensional._set_achievement(dimensional._get_fact_totals())
+        targets -= dimensional
+        # Deferred rows are counted by the source totals: apply them first so
+        # the queue does not add them a second time after the reset
+        targets._apply_pending_achievement()
+        source_totals = targets._get_source_totals()
+        ledger_totals = targets._get_ledger_totals()
+        today = fields.Date.context_today(self)
+        entries = []
+        for target in targets:
+            delta = source_totals.get(target.id, 0.0) - ledger_totals.get(target.id, 0.0)
+            if not target.currency_id.is_zero(delta):
+                entries.append((target, target, 'adjustment', delta, today))
+        self.env['sales.target.achievement.line'].sudo()._record(self._ledger_target_field, entries)
+        self.invalidate_model(['achievement_line_ids'])
+        targets._set_achievement({target.id: source_totals.get(target.id, 0.0) for target in targets})
+
+    def action_recompute_achievement(self):
+        self.sudo()._recompute_achievement()
+
+    @api.model
+    def _cron_recompute_achievement(self, chunk_size=1000):
+        """Recompute every open target, company by company, in chunks.
+
+        Progress is stored on a ``sales.target.recompute.job`` and committed
+        with each chunk, so a killed run resumes after the last chunk done.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        job = self.env['sales.target.recompute.job'].sudo()._get_or_start(self._name)
+        # Targets without company are processed first, as company 0
+        scopes = [0, *self.env['res.company'].sudo().search([], order='id').ids]
+        for scope in scopes[scopes.index(job.company_scope) if job.company_scope in scopes else 0:]:
+            last_id = job.last_id if scope == job.company_scope else 0
+            while True:
+                chunk = self.sudo().search([
+                    ('state', '=', 'open'),
+                    ('company_id', '=', scope or False),
+                    ('id', '>', last_id),
+                ], order='id', limit=chunk_size)
+                if not chunk:
+                    break
+                chunk._recompute_achievement()
+                last_id = chunk[-1].id
+                job.write({
+                    'company_scope': scope,
+                    'last_id': last_id,
+                    'done_count': job.done_count + len(chunk),
+                })
+                if auto_commit:
+                    self.env.cr.commit()
+                # Keep memory flat over the whole run
+                self.env.invalidate_all()
+        job.write({'date_done': fields.Datetime.now()})
+
+    # ======================
+    # BULK MAIL
+    # ======================
+    def _queue_target_mail(self, batch_size=MAIL_BATCH_SIZE, auto_commit=False):
+        """Queue the result e-mail of the targets, without any wizard.
+
+        The template is rendered for a whole batch per call and the created
+        ``mail.mail`` are left to the mail queue cron, which sends them with
+        its own batching and throttling.
+        """
+        template = self.env.ref(self._target_mail_template)
+        today = fields.Date.context_today(self)
+        for batch in split_every(batch_size, self.ids, self.browse):
+            template.send_mail_batch(batch.ids)
+            batch.write({'mail_sent_date': today})
+            if auto_commit:
+                self.env.cr.commit()
+                self.env.invalidate_all()
+        self.env.ref('mail.ir_cron_mail_scheduler_action')._trigger()
+
+    def action_queue_mail(self):
+        targets = self.filtered(lambda target: target.state != 'draft')
+        targets._queue_target_mail()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': "%s target e-mail(s) queued for sending." % len(targets),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
+
+    @api.model
+    def _cron_send_target_mail(self, lookback_days=7):
+        """Send the results of the targets whose period has just ended.
+
+        Targets mailed after their end date are skipped, so the job can be
+        rerun or catch up on missed days without sending twice.
+        """
+        today = fields.Date.context_today(self)
+        targets = self.search([
+            ('state', 'in', ('open', 'closed')),
+            ('end_date', '<', today),
+            ('end_date', '>=', today - timedelta(days=lookback_days)),
+        ]).filtered(lambda target: not target.mail_sent_date or target.mail_sent_date <= target.end_date)
+        targets._queue_target_mail(
+            auto_commit=not getattr(threading.current_thread(), 'testing', False))
+
+    # ======================
+    # PROGRESS API
+    # ======================
+    def _get_progress_sequence(self):
+        return f"{self._table}_progress_seq"
+
+    def _get_progress_version_sql(self):
+        """SQL value of ``progress_version`` for a row being changed."""
+        return SQL("nextval(%s)", self._get_progress_sequence())
+
+    def _bump_progress_version(self):
+        if not self:
+            return
+        self.env.cr.execute(SQL(
+            "UPDATE %s SET progress_version = %s WHERE id IN %s",
+            SQL.identifier(self._table), self._get_progress_version_sql(), tuple(self.ids),
+        ))
+        self.invalidate_recordset(['progress_version'])
+
+    @api.model
+    def _get_progress_fields(self):
+        """Stored fields returned by :meth:`_get_progress`."""
+        return [
+            'name', self._target_owner_field, 'company_id', 'currency_id', 'target_point', 'state',
+            'start_date', 'end_date', self._target_amount_field, self._target_achievement_field,
+            self._target_percent_field, self._target_theoretical_field, 'theoretical_status',
+        ]
+
+    @api.model
+    def _get_progress_version(self, domain):
+        """Cheap version of the targets matching ``domain``: their count and
+        the sum of their ``progress_version``.
+
+        Every change of the progress values draws a new number from a
+        sequence while the row is locked, higher than the one it replaces,
+        so every committed change raises the sum; unlike the last write
+        date, even when a transaction started earlier commits later.
+        """
+        self.flush_model(['progress_version'])
+        [(count, version)] = self._read_group(domain, [], ['__count', 'progress_version:sum'])
+        return version, count
+
+    @api.model
+    def _get_progress(self, domain, offset=0, limit=None):
+        """Progress of the targets matching ``domain``, read from stored
+        fields only, as a list of JSON-serializable dicts."""
+        owner_field = self._target_owner_field
+        targets = self.search_fetch(
+            domain, self._get_progress_fields(),
+            offset=offset, limit=limit, order='start_date desc, id desc',
+        )
+        return [{
+            'id': target.id,
+            'name': target.name,
+            'owner': {'id': target[owner_field].id, 'name': target[owner_field].display_name},
+            'company_id': target.company_id.id,
+            'currency': target.currency_id.name,
+            'target_point': target.target_point,
+            'state': target.state,
+            'start_date': fields.Date.to_string(target.start_date),
+            'end_date': fields.Date.to_string(target.end_date),
+            'target': target[self._target_amount_field],
+            'achievement': target[self._target_achievement_field],
+            'percent': target[self._target_percent_field],
+            'theoretical': target[self._target_theoretical_field],
+            'theoretical_status': target.theoretical_status,
+        } for target in targets]
+
+    # ======================
+    # FORECAST
+    # ======================
+    def _forecast(self):
+        """Forecast where the targets land at their end date, in one NumPy
+        pass over their daily achievement history.
+
+        The history is read from the daily snapshots, with today's stored
+        achievement as the last point; days without a snapshot are
+        interpolated. Targets not started yet are left alone.
+        """
+        today = fields.Date.context_today(self)
+        targets = self.filtered(lambda target: target.start_date and target.end_date
+                                and target.start_date <= today)
+        if not targets:
+            return
+        self.env['sales.target.snapshot'].flush_model()
+        column = SQL.identifier(self._ledger_target_field)
+        self.env.cr.execute(SQL(
+            """
+            SELECT %(column)s, date, achievement
+              FROM sales_target_snapshot
+             WHERE %(column)s IN %(ids)s AND date < %(today)s
+            """,
+            column=column,
+            ids=tuple(targets.ids),
+            today=today,
+        ))
+        history = self.env.cr.fetchall()
+
+        starts = [target.start_date for target in targets]
+        lengths = np.array([(target.end_date - target.start_date).days + 1 for target in targets])
+        elapsed = np.array([(min(today, target.end_date) - target.start_date).days + 1 for target in targets])
+        current = np.array([target[self._target_achievement_field] or 0.0 for target in targets])
+        amounts = np.array([target[self._target_amount_field] or 0.0 for target in targets])
+        use_trend = np.array([target.forecast_method == 'trend' for target in targets])
+
+        # Column 0 is the day before the start, column d day d of the period
+        values = np.zeros((len(targets), lengths.max() + 1))
+        observed = np.zeros(values.shape, dtype=bool)
+        observed[:, 0] = True
+        row_of = {target_id: row for row, target_id in enumerate(targets.ids)}
+        for target_id, date, achievement in history:
+            row = row_of[target_id]
+            day = (date - starts[row]).days + 1
+            if 0 < day < elapsed[row]:
+                values[row, day] = achievement or 0.0
+                observed[row, day] = True
+        rows = np.arange(len(targets))
+        values[rows, elapsed] = current
+        observed[rows, elapsed] = True
+
+        remaining = lengths - elapsed
+        trend, trend_error = forecast_trend(values, observed, lengths.astype(float))
+        ewma, ewma_error = forecast_ewma(values, observed, current, remaining)
+        # Periods already over are known
+        forecast = np.where(remaining > 0, np.where(use_trend, trend, ewma), current)
+        error = np.where(remaining > 0, np.where(use_trend, trend_error, ewma_error), 0.0)
+        low = forecast - CONFIDENCE_Z * error
+        high = forecast + CONFIDENCE_Z * error
+        percent = np.divide(forecast * 100, amounts, out=np.zeros_like(forecast), where=amounts > 0)
+        status = np.where((amounts <= 0) | (low >= amounts), 'hit', np.where(high < amounts, 'miss', 'at_risk'))
+
+        self._write_forecasts(list(zip(
+            targets.ids, forecast.tolist(), low.tolist(), high.tolist(), percent.tolist(), status.tolist(),
+        )), today)
+
+    def _write_forecasts(self, rows, today):
+        """Store ``(target id, forecast, low, high, percent, status)`` rows,
+        one ``UPDATE`` per thousand targets."""
+        for chunk in split_every(1000, rows):
+            self.env.cr.execute(SQL(
+                """
+                UPDATE %(table)s t
+                   SET forecast_amount = v.amount,
+                       forecast_low = v.low,
+                       forecast_high = v.high,
+                       forecast_percent = v.percent,
+                       forecast_status = v.status,
+                       forecast_date = %(today)s,
+                       progress_version = %(version)s
+                  FROM (VALUES %(values)s) AS v(target_id, amount, low, high, percent, status)
+                 WHERE t.id = v.target_id
+                """,
+                table=SQL.identifier(self._table),
+                today=today,
+                version=self._get_progress_version_sql(),
+                values=SQL(", ").join(
+                    SQL("(%s, %s::numeric, %s::numeric, %s::numeric, %s::float, %s)", *row) for row in chunk
+                ),
+            ))
+        self.invalidate_model(['forecast_amount', 'forecast_low', 'forecast_high', 'forecast_percent',
+                               'forecast_status', 'forecast_date', 'progress_version'])
+
+    def action_forecast(self):
+        self.sudo()._forecast()
+
+    @api.model
+    def _cron_forecast(self, batch_size=FORECAST_BATCH_SIZE):
+        """Forecast every open target, ``batch_size`` targets per NumPy pass,
+        each batch committed on its own."""
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        targets = self.sudo().search([
+            ('state', '=', 'open'),
+            ('start_date', '<=', fields.Date.context_today(self)),
+        ], order='id')
+        for target_ids in split_every(batch_size, targets.ids):
+            self.sudo().browse(target_ids)._forecast()
+            if auto_commit:
+                self.env.cr.commit()
+            self.env.invalidate_all()
+
+    # ======================
+    # LEADERBOARD
+    # ======================
+    @api.model
+    def _get_leaderboard_fields(self):
+        """Fields whose change moves targets in the leaderboards."""
+        return {
+            self._target_owner_field, self._target_amount_field, self._target_achievement_field,
+            'name', 'state', 'start_date', 'end_date', 'company_id', 'dimension',
+        }
+
+    @api.model
+    def _invalidate_leaderboard(self):
+        """Drop the cached leaderboards of this model once the transaction
+        commits, so a concurrent read cannot cache uncommitted values."""
+        self.env.cr.postcommit.add(partial(_clear_leaderboards, self.env.cr.dbname, self._name))
+
+    @api.model
+    def _query_leaderboard(self, company_id, date):
+        """Rank the open whole-document targets of ``company_id`` in progress
+        on ``date``, among the targets of the same period, in one query.
+
+        Targets are ranked by achievement percentage and by their gap to the
+        theoretical achievement, as a percentage of the target so that small
+        and large targets compare. Only stored columns are read.
+        """
+        self.flush_model()
+        target = SQL("t.%s", SQL.identifier(self._target_amount_field))
+        achievement = SQL("COALESCE(t.%s, 0)", SQL.identifier(self._target_achievement_field))
+        percent = SQL("COALESCE(t.%s, 0)", SQL.identifier(self._target_percent_field))
+        gap = SQL(
+            "CASE WHEN COALESCE(%(target)s, 0) != 0"
+            " THEN (%(achievement)s - COALESCE(t.%(theoretical)s, 0)) * 100 / %(target)s ELSE 0 END",
+            target=target,
+            achievement=achievement,
+            theoretical=SQL.identifier(self._target_theoretical_field),
+        )
+        self.env.cr.execute(SQL(
+            """
+            SELECT t.id, t.name, t.%(owner)s, t.start_date, t.end_date, t.target_point,
+                   COALESCE(%(target)s, 0), %(achievement)s, %(percent)s, %(gap)s,
+                   RANK() OVER (period ORDER BY %(percent)s DESC),
+                   RANK() OVER (period ORDER BY %(gap)s DESC),
+                   COUNT(*) OVER period
+              FROM %(table)s t
+             WHERE t.state = 'open'
+               AND t.dimension = 'none'
+               AND %(date)s::date BETWEEN t.start_date AND t.end_date
+               AND (t.company_id = %(company_id)s OR t.company_id IS NULL)
+            WINDOW period AS (PARTITION BY t.start_date, t.end_date)
+             ORDER BY t.start_date, t.end_date, 11, t.id
+            """,
+            owner=SQL.identifier(self._target_owner_field),
+            target=target,
+            achievement=achievement,
+            percent=percent,
+            gap=gap,
+            table=SQL.identifier(self._table),
+            date=date,
+            company_id=company_id,
+        ))
+        rows = self.env.cr.fetchall()
+        owners = self[self._target_owner_field].sudo().browse({row[2] for row in rows})
+        names = {owner.id: owner.display_name for owner in owners}
+        return [{
+            'id': target_id,
+            'name': name,
+            'owner': {'id': owner_id, 'name': names.get(owner_id)},
+            'start_date': fields.Date.to_string(start_date),
+            'end_date': fields.Date.to_string(end_date),
+            'target_point': target_point,
+            'target': target_amount,
+            'achievement': achievement_amount,
+            'percent': achievement_percent,
+            'gap_percent': gap_percent,
+            'rank': rank,
+            'gap_rank': gap_rank,
+            'period_count': period_count,
+        } for (target_id, name, owner_id, start_date, end_date, target_point, target_amount,
+               achievement_amount, achievement_percent, gap_percent, rank, gap_rank, period_count) in rows]
+
+    @api.model
+    def _get_leaderboard(self, company_id, date):
+        """:meth:`_query_leaderboard`, served from the worker cache for up to
+        :data:`LEADERBOARD_TTL` seconds."""
+        now = time.monotonic()
+        key = (self.env.cr.dbname, self._name, company_id, date)
+        cached = _leaderboard_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        rows = self._query_leaderboard(company_id, date)
+        for stale_key, (expiry, __) in list(_leaderboard_cache.items()):
+            if expiry <= now:
+                _leaderboard_cache.pop(stale_key, None)
+        _leaderboard_cache[key] = (now + LEADERBOARD_TTL, rows)
+        return rows
+
+    @api.model
+    def get_leaderboard(self, company_id=None, date=None):
+        """Leaderboard of the company on ``date`` (today by default), for
+        dashboards: every open target ranked within its period."""
+        company_id = company_id or self.env.company.id
+        if company_id not in self.env.user.company_ids.ids:
+            raise AccessError("You are not allowed to access the leaderboard of this company.")
+        date = fields.Date.to_date(date) or fields.Date.context_today(self)
+        return self._get_leaderboard(company_id, date)
+
+    def _compute_leaderboard_rank(self):
+        today = fields.Date.context_today(self)
+        ranks = {}
+        for company in {rec.company_id or self.env.company for rec in self}:
+            ranks.update((row['id'], row) for row in self._get_leaderboard(company.id, today))
+        for rec in self:
+            row = ranks.get(rec._origin.id)
+            rec.leaderboard_rank = row['rank'] if row else 0
+            rec.leaderboard_gap_rank = row['gap_rank'] if row else 0
+
+    # ======================
+    # PRODUCT DIMENSION
+    # ======================
+    @api.model
+    def _get_fact_condition(self, alias):
+        """Whether the facts ``alias`` fall in the product or category of the
+        target ``t``; categories include their subcategories."""
+        alias = SQL.identifier(alias)
+        return SQL(
+            """
+            CASE t.dimension
+                WHEN 'product' THEN %(alias)s.product_id = t.product_id
+                WHEN 'category' THEN %(alias)s.categ_id IN (
+                    SELECT c.id
+                      FROM product_category c
+                      JOIN product_category tc ON c.parent_path LIKE tc.parent_path || %(any)s
+                     WHERE tc.id = t.product_categ_id
+                )
+                ELSE FALSE
+            END
+            """,
+            alias=alias,
+            any='%',
+        )
+
+    def _convert_fact_groups(self, groups):
+        """Sum ``(target id, from currency, to currency, company, date, amount)``
+        groups per target, in the currency of the target."""
+        amounts = self._convert_amount_groups([group[1:] for group in groups])
+        totals = defaultdict(float)
+        for (target_id, *__), amount in zip(groups, amounts):
+            totals[target_id] += amount
+        return totals
+
+    def _get_fact_totals(self):
+        """Achievement of product and category targets, as one range sum over
+        the daily line facts. Returns ``{target id: amount}``."""
+        targets = self._origin.filtered(lambda target: target.dimension != 'none')
+        if not targets:
+            return {}
+        targets.flush_recordset()
+        self.env['sales.target.fact'].flush_model()
+        owner = SQL.identifier(self._target_owner_field)
+        self.env.cr.execute(SQL(
+            """
+            SELECT t.id, f.currency_id, t.currency_id, f.company_id,
+                   CASE WHEN f.currency_id = t.currency_id THEN NULL ELSE f.date END,
+                   SUM(f.amount)
+              FROM %(table)s t
+              JOIN sales_target_fact f ON f.%(owner)s = t.%(owner)s
+                                      AND f.target_point = t.target_point
+                                      AND f.date BETWEEN t.start_date AND t.end_date
+                                      AND (f.company_id = t.company_id OR t.company_id IS NULL)
+             WHERE t.id IN %(ids)s AND %(condition)s
+             GROUP BY 1, 2, 3, 4, 5
+            """,
+            table=SQL.identifier(self._table),
+            owner=owner,
+            ids=tuple(targets.ids),
+            condition=self._get_fact_condition('f'),
+        ))
+        totals = dict.fromkeys(targets.ids, 0.0)
+        totals.update(self._convert_fact_groups(self.env.cr.fetchall()))
+        return totals
+
+    @api.model
+    def _add_fact_achievement(self, rows):
+        """Add changed line facts to the open product and category targets
+        they fall in, with one lookup and one increment per target.
+
+        ``rows`` are ``(*FACT_COLUMNS, amount)`` tuples. The increments are
+        applied right away, in deferred mode too: these targets have no
+        ledger to queue them in, their achievement is read from the facts.
+        """
+        owner_index = FACT_COLUMNS.index(self._target_owner_field)
+        rows = [row for row in rows if row[owner_index]]
+        if not rows:
+            return
+        self.flush_model()
+        columns = SQL(", ").join(SQL.identifier(column) for column in (*FACT_COLUMNS, 'amount'))
+        self.env.cr.execute(SQL(
+            """
+            SELECT t.id, v.currency_id, t.currency_id, v.company_id, v.date, SUM(v.amount)
+              FROM (VALUES %(values)s) AS v(%(columns)s)
+              JOIN %(table)s t ON t.%(owner)s = v.%(owner)s
+                              AND t.target_point = v.target_point
+                              AND t.state = 'open'
+                              AND t.dimension != 'none'
+                              AND v.date BETWEEN t.start_date AND t.end_date
+                              AND (t.company_id = v.company_id OR t.company_id IS NULL)
+             WHERE %(condition)s
+             GROUP BY 1, 2, 3, 4, 5
+            """,
+            values=SQL(", ").join(
+                SQL("(%s, %s::date, %s::int, %s::int, %s::int, %s::int, %s::int, %s::int, %s::numeric)", *row)
+                for row in rows
+            ),
+            columns=columns,
+            table=SQL.identifier(self._table),
+            owner=SQL.identifier(self._target_owner_field),
+            condition=self._get_fact_condition('v'),
+        ))
+        increments = self._convert_fact_groups(self.env.cr.fetchall())
+        if increments:
+            self._add_achievement(increments)
+
+    # ======================
+    # CLOSING
+    # ======================
+    @api.model
+    def _get_frozen_fields(self):
+        """Fields that cannot change once a target is closed."""
+        return {
+            self._target_owner_field, self._target_amount_field, 'target_point',
+            'start_date', 'end_date', 'currency_id', 'company_id',
+            'dimension', 'product_categ_id', 'product_id',
+        }
+
+    def _freeze(self):
+        """Store the final totals and document counts of targets being closed.
+
+        Computed with one batch per field while the targets are still open,
+        and written with one ``write`` per distinct set of values; once
+        closed, the totals and counts are read from these columns and
+        achievement and theoretical values are no longer updated.
+        """
+        self._apply_pending_achievement()
+        groups = defaultdict(list)
+        for rec in self:
+            groups[rec.sale_total, rec.invoice_total, rec.order_count, rec.invoice_count].append(rec.id)
+        for (sale_total, invoice_total, order_count, invoice_count), ids in groups.items():
+            self.browse(ids).write({
+                'closed_sale_total': sale_total,
+                'closed_invoice_total': invoice_total,
+                'closed_order_count': order_count,
+                'closed_invoice_count': invoice_count,
+            })
+
+    # ======================
+    # SMART BUTTONS
+    # ======================
+    def _get_document_domain(self, model_name):
+        """Domain of the sale orders / invoices counted by one target: the
+        documents of :meth:`_get_sale_aggregates` / :meth:`_get_invoice_aggregates`,
+        or those linked to it once closed."""
+        self.ensure_one()
+        if self.state == 'closed':
+            return [(self._ledger_target_field, '=', self.id)]
+        scope = [(self._document_owner_columns[model_name], '=', self[self._target_owner_field].id)]
+        if self.company_id:
+            scope.append(('company_id', '=', self.company_id.id))
+        if model_name == 'sale.order':
+            return [
+                *scope,
+                ('state', 'in', ('sale', 'done')),
+                ('date_order', '>=', fields.Datetime.to_datetime(self.start_date)),
+                ('date_order', '<', fields.Datetime.to_datetime(self.end_date + timedelta(days=1))),
+            ]
+        return [
+            *scope,
+            ('move_type', 'in', ('out_invoice', 'out_refund')),
+            ('state', '=', 'posted'),
+            ('invoice_date', '>=', self.start_date),
+            ('invoice_date', '<=', self.end_date),
+            *self._get_invoice_point_domain(self.target_point),
+        ]
+
+    @api.model
+    def _get_invoice_point_domain(self, target_point):
+        """Domain counterpart of :meth:`_get_invoice_point_condition`."""
+        if target_point == 'invoice_paid':
+            return [('payment_state', '=', 'paid')]
+        return []
+
+    def action_view_orders(self):
+        """Paginated list of the orders, instead of loading them all in the form."""
+        self.ensure_one()
+        return {
+            'name': "Sales Orders",
+            'type': 'ir.actions.act_window',
+            'res_model': 'sale.order',
+            'view_mode': 'list,form',
+            'domain': self._get_document_domain('sale.order'),
+            'context': {'create': False},
+        }
+
+    def action_view_invoices(self):
+        self.ensure_one()
+        list_view = self.env.ref('account.view_invoice_tree', raise_if_not_found=False)
+        return {
+            'name': "Invoices",
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move',
+            'views': [(list_view.id if list_view else False, 'list'), (False, 'form')],
+            'domain': self._get_document_domain('account.move'),
+            'context': {'create': False},
+        }
+
+    def _get_linked_documents(self, model_name):
+        """Documents linked to the targets, as ``{target id: documents}``, with one search."""
+        documents = self.env[model_name].search([(self._ledger_target_field, 'in', self._origin.ids)])
+        return {target.id: docs for target, docs in documents.grouped(self._ledger_target_field).items()}
+
+    # ======================
+    # BULK GENERATION
+    # ======================
+    @api.model
+    def _reserve_names(self, count, company=None):
+        """Allocate ``count`` references of the target sequence of ``company``
+        (the current company by default) at once.
+
+        Standard sequences draw all numbers with a single ``nextval`` query and
+        no-gap ones with a single ``UPDATE``, instead of one call per target.
+        """
+        if not count:
+            return []
+        company = company or self.env.company
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', self._target_sequence_code),
+            ('company_id', 'in', [company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence:
+            return ["New"] * count
+        if sequence.use_date_range:
+            return [sequence._next() for __ in range(count)]
+        if sequence.implementation == 'standard':
+            self.env.cr.execute(SQL(
+                "SELECT nextval(%s) FROM generate_series(1, %s)", f"ir_sequence_{sequence.id:03d}", count,
+            ))
+            numbers = [number for number, in self.env.cr.fetchall()]
+        else:
+            step = sequence.number_increment
+            self.env.cr.execute(SQL(
+                "UPDATE ir_sequence SET number_next = number_next + %s WHERE id = %s RETURNING number_next",
+                step * count, sequence.id,
+            ))
+            [(number_next,)] = self.env.cr.fetchall()
+            sequence.invalidate_recordset(['number_next'])
+            numbers = range(number_next - step * count, number_next, step)
+        return [sequence.get_next_char(number) for number in numbers]
+
+    @api.model
+    def _check_period_overlaps(self, vals_list):
+        """Check new targets against each other and the existing ones with one
+        query, so a whole batch fails with a readable message before insert."""
+        owner_field = self._target_owner_field
+        keys = [
+            (vals[owner_field], vals.get('target_point') or 'so_confirm', vals.get('dimension') or 'none',
+             vals.get('product_categ_id') or 0, vals.get('product_id') or 0, vals['start_date'], vals['end_date'])
+            for vals in vals_list
+        ]
+        conflicts = set()
+        by_owner = defaultdict(list)
+        for owner_id, *dimension, start, end in keys:
+            for other_start, other_end in by_owner[owner_id, *dimension]:
+                if start <= other_end and other_start <= end:
+                    conflicts.add(owner_id)
+            by_owner[owner_id, *dimension].append((start, end))
+        if keys:
+            self.flush_model([owner_field, 'target_point', 'start_date', 'end_date',
+                              'dimension', 'product_categ_id', 'product_id'])
+            self.env.cr.execute(SQL(
+                """
+                SELECT DISTINCT t.%(owner)s
+                  FROM (VALUES %(values)s)
+                       AS v(owner_id, target_point, dimension, product_categ_id, product_id, start_date, end_date)
+                  JOIN %(table)s t ON t.%(owner)s = v.owner_id
+                                  AND t.target_point = v.target_point
+                                  AND t.dimension = v.dimension
+                                  AND COALESCE(t.product_categ_id, 0) = v.product_categ_id
+                                  AND COALESCE(t.product_id, 0) = v.product_id
+                                  AND daterange(t.start_date, t.end_date, '[]')
+                                   && daterange(v.start_date, v.end_date, '[]')
+                """,
+                owner=SQL.identifier(owner_field),
+                values=SQL(", ").join(
+                    SQL("(%s, %s, %s, %s, %s, %s::date, %s::date)", *key) for key in keys
+                ),
+                table=SQL.identifier(self._table),
+            ))
+            conflicts.update(owner_id for owner_id, in self.env.cr.fetchall())
+        if conflicts:
+            owners = self[owner_field].browse(sorted(conflicts))
+            raise UserError("These already have a target with the same target point and dimension "
+                            "in this period:\n%s"
+                            % "\n".join(owners.mapped('display_name')))
+
+    @api.model
+    def _prepare_generated_vals(self, owner, target_point, amount, start_date, end_date, company, source=None):
+        """Values of one target created by the generation wizard.
+
+        ``source`` is the target of the previous period it is copied from, if any.
+        """
+        return {
+            self._target_owner_field: owner.id,
+            'target_point': target_point,
+            self._target_amount_field: amount,
+            'start_date': start_date,
+            'end_date': end_date,
+            'company_id': company.id,
+            'currency_id': (source.currency_id if source else company.currency_id).id,
+            'dimension': source.dimension if source else 'none',
+            'product_categ_id': source.product_categ_id.id if source else False,
+            'product_id': source.product_id.id if source else False,
+        }
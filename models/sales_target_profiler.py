@@ -0,0 +1,129 @@
+import functools
+import logging
+import threading
+import time
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+PROFILING_PARAM = 'sales_target_omax.profiling'
+# Seconds between two summaries written to the log by one worker
+LOG_INTERVAL = 300
+
+# Per-worker statistics: {hook name: [calls, wall time, queries, rows]}
+_stats = {}
+_stats_lock = threading.Lock()
+_last_log = [time.monotonic()]
+# Row counters of the hooks being profiled in the current thread, outermost first
+_active = threading.local()
+
+
+def profiled(name):
+    """Record call count, wall time, SQL queries and rows of a hook.
+
+    Does nothing unless the ``sales_target_omax.profiling`` system parameter
+    is set. Times include everything the method calls, ``super()`` included.
+    Rows are the ledger, fact and target rows the hook actually inserted or
+    updated, as reported by :func:`count_rows`.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.env['ir.config_parameter'].sudo().get_param(PROFILING_PARAM):
+                return method(self, *args, **kwargs)
+            cr = self.env.cr
+            counters = _active.__dict__.setdefault('counters', [])
+            counter = [0]
+            counters.append(counter)
+            queries = cr.sql_log_count
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                counters.pop()
+                _record(name, time.perf_counter() - started, cr.sql_log_count - queries, counter[0])
+        return wrapper
+    return decorator
+
+
+def count_rows(count):
+    """Add ``count`` rows returned by an ``INSERT`` / ``UPDATE ... RETURNING``
+    to every hook being profiled in this thread."""
+    for counter in getattr(_active, 'counters', ()):
+        counter[0] += count
+
+
+def _record(name, elapsed, queries, rows):
+    with _stats_lock:
+        stat = _stats.setdefault(name, [0, 0.0, 0, 0])
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] += queries
+        stat[3] += rows
+        log_now = time.monotonic() - _last_log[0] >= LOG_INTERVAL
+        if log_now:
+            _last_log[0] = time.monotonic()
+    if log_now:
+        log_summary()
+
+
+def get_stats():
+    with _stats_lock:
+        return {name: tuple(stat) for name, stat in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def log_summary():
+    stats = get_stats()
+    if not stats:
+        return
+    lines = [
+        "%-45s calls=%-7d time=%.3fs queries=%-8d rows=%d" % (name, calls, elapsed, queries, rows)
+        for name, (calls, elapsed, queries, rows) in sorted(stats.items(), key=lambda item: -item[1][1])
+    ]
+    _logger.info("sales_target_omax hook profile:\n%s", "\n".join(lines))
+
+
+class SalesTargetProfileStat(models.TransientModel):
+    _name = "sales.target.profile.stat"
+    _description = "Sales Target Hook Profile"
+    _order = "total_time desc"
+
+    name = fields.Char(string="Hook", readonly=True)
+    calls = fields.Integer(string="Calls", readonly=True)
+    total_time = fields.Float(string="Wall Time (s)", digits=(16, 3), readonly=True)
+    avg_time = fields.Float(string="Avg Time (ms)", digits=(16, 2), readonly=True)
+    queries = fields.Integer(string="Queries", readonly=True)
+    avg_queries = fields.Float(string="Avg Queries", digits=(16, 1), readonly=True)
+    rows = fields.Integer(string="Rows Written", readonly=True)
+
+    @api.model
+    def action_open(self):
+        """Snapshot this worker's statistics and show them."""
+        records = self.create([{
+            'name': name,
+            'calls': calls,
+            'total_time': elapsed,
+            'avg_time': elapsed * 1000 / calls if calls else 0,
+            'queries': queries,
+            'avg_queries': queries / calls if calls else 0,
+            'rows': rows,
+        } for name, (calls, elapsed, queries, rows) in get_stats().items()])
+        return {
+            'name': "Sales Target Hook Profile",
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'view_mode': 'list',
+            'domain': [('id', 'in', records.ids)],
+        }
+
+    @api.model
+    def action_reset(self):
+        log_summary()
+        reset_stats()
+        return self.action_open()
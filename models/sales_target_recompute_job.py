@@ -0,0 +1,20 @@
+from odoo import models, fields, api
+
+
+class SalesTargetRecomputeJob(models.Model):
+    _name = "sales.target.recompute.job"
+    _description = "Sales Target Recompute Progress"
+    _order = "id desc"
+
+    res_model = fields.Char(string="Target Model", required=True, index=True)
+    company_scope = fields.Integer(string="Current Company", help="Company being processed, 0 for targets without company.")
+    last_id = fields.Integer(string="Last Target Done")
+    done_count = fields.Integer(string="Targets Done")
+    date_start = fields.Datetime(string="Started", default=fields.Datetime.now)
+    date_done = fields.Datetime(string="Finished")
+
+    @api.model
+    def _get_or_start(self, res_model):
+        """Return the unfinished run of ``res_model``, or start a new one."""
+        job = self.search([('res_model', '=', res_model), ('date_done', '=', False)], limit=1)
+        return job or self.create({'res_model': res_model})
@@ -0,0 +1,268 @@
+from collections import defaultdict
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+
+class SalesTargetSnapshot(models.Model):
+    _name = "sales.target.snapshot"
+    _description = "Sales Target Daily Snapshot"
+    _order = "date desc, id desc"
+    _rec_name = "date"
+
+    date = fields.Date(string="Date", required=True, index=True, readonly=True)
+    sales_target_id = fields.Many2one(
+        'sales.target', string="Salesperson Target", ondelete='cascade', readonly=True)
+    sales_team_target_id = fields.Many2one(
+        'sales.team.target', string="Sales Team Target", ondelete='cascade', readonly=True)
+    salesperson_id = fields.Many2one('res.users', string="Salesperson", readonly=True)
+    team_id = fields.Many2one('crm.team', string="Sales Team", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", readonly=True)
+    target_point = fields.Selection([
+        ('so_confirm', 'Sale Order Confirm'),
+        ('invoice_validation', 'Invoice Validation'),
+        ('invoice_paid', 'Invoice Paid'),
+    ], string="Target Point", readonly=True)
+
+    target_amount = fields.Monetary(string="Target", currency_field="currency_id", readonly=True)
+    achievement = fields.Monetary(
+        string="Achievement", currency_field="currency_id", readonly=True,
+        help="Cumulative achievement at the end of the day.")
+    theoretical = fields.Monetary(
+        string="Theoretical Achievement", currency_field="currency_id", readonly=True)
+
+    _TARGET_MODELS = ('sales.target', 'sales.team.target')
+
+    def init(self):
+        # One row per target per day; also serves the per-target trend queries
+        for column in ('sales_target_id', 'sales_team_target_id'):
+            self.env.cr.execute(SQL(
+                """
+                CREATE UNIQUE INDEX IF NOT EXISTS %(index)s
+                    ON %(table)s (%(column)s, date)
+                 WHERE %(column)s IS NOT NULL
+                """,
+                index=SQL.identifier(f"{self._table}_{column}_date_uniq"),
+                table=SQL.identifier(self._table),
+                column=SQL.identifier(column),
+            ))
+
+    @api.model
+    def _upsert(self, targets_model, select):
+        """Insert or refresh snapshot rows from a :meth:`_get_select` query."""
+        column = targets_model._ledger_target_field
+        owner = targets_model._target_owner_field
+        targets_model.flush_model()
+        self.env['sales.target.achievement.line'].flush_model()
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO %(table)s (%(column)s, %(owner)s, date, company_id, currency_id, target_point,
+                                   target_amount, achievement, theoretical,
+                                   create_uid, write_uid, create_date, write_date)
+            SELECT s.target_id, s.owner_id, s.day, s.company_id, s.currency_id, s.target_point,
+                   s.target_amount, s.achievement, s.theoretical,
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM (%(select)s) s
+            ON CONFLICT (%(column)s, date) WHERE %(column)s IS NOT NULL
+            DO UPDATE SET target_amount = EXCLUDED.target_amount,
+                          achievement = EXCLUDED.achievement,
+                          theoretical = EXCLUDED.theoretical,
+                          write_uid = EXCLUDED.write_uid,
+                          write_date = EXCLUDED.write_date
+            """,
+            table=SQL.identifier(self._table),
+            column=SQL.identifier(column),
+            owner=SQL.identifier(owner),
+            uid=self.env.uid,
+            select=select,
+        ))
+        self.invalidate_model()
+
+    @api.model
+    def _get_select(self, targets_model, day, achievement, where, extra_from=SQL()):
+        """``SELECT`` of the snapshot columns over the target table ``t``.
+
+        ``day`` and ``achievement`` are SQL expressions of the snapshot day
+        and of the cumulative achievement on that day.
+        """
+        target = SQL("t.%s", SQL.identifier(targets_model._target_amount_field))
+        return SQL(
+            """
+            SELECT t.id AS target_id, t.%(owner)s AS owner_id, %(day)s AS day,
+                   t.company_id, t.currency_id, t.target_point,
+                   %(target)s AS target_amount,
+                   %(achievement)s AS achievement,
+                   CASE WHEN COALESCE(%(target)s, 0) = 0 THEN 0
+                        ELSE %(target)s * (LEAST(%(day)s, t.end_date) - t.start_date + 1)
+                                        / (t.end_date - t.start_date + 1)
+                   END AS theoretical
+              FROM %(target_table)s t
+              %(extra_from)s
+             WHERE %(where)s
+            """,
+            owner=SQL.identifier(targets_model._target_owner_field),
+            day=day,
+            target=target,
+            achievement=achievement,
+            target_table=SQL.identifier(targets_model._table),
+            extra_from=extra_from,
+            where=where,
+        )
+
+    @api.model
+    def _cron_take_snapshot(self):
+        """Record today's cumulative achievement of every open target."""
+        today = fields.Date.context_today(self)
+        for model_name in self._TARGET_MODELS:
+            targets_model = self.env[model_name]
+            achievement = SQL("COALESCE(t.%s, 0)", SQL.identifier(targets_model._target_achievement_field))
+            self._upsert(targets_model, self._get_select(
+                targets_model, SQL("%s::date", today), achievement,
+                SQL("t.state = 'open' AND t.start_date <= %s", today),
+            ))
+
+    @api.model
+    def _backfill(self, targets):
+        """Rebuild the whole daily history of ``targets``.
+
+        Daily amounts are accumulated with a window function, so the history
+        of any number of targets is written by a single statement per source.
+        Whole-document targets are rebuilt from their ledger; product and
+        category targets from the daily line facts, and rollup team targets
+        from the history of their member targets. Ledger rows dated outside
+        a period are counted on its first or last day.
+        """
+        if not targets:
+            return
+        computed = self._get_rollup_targets(targets) | targets.filtered(lambda target: target.dimension != 'none')
+        ledger_targets = targets - computed
+        if ledger_targets:
+            self._upsert_history(ledger_targets, self._get_ledger_daily(ledger_targets))
+        if computed:
+            daily = self._get_daily_amounts(computed)
+            self._upsert_history(computed, SQL(
+                "SELECT * FROM (VALUES %s) AS v(target_id, day, amount)",
+                SQL(", ").join(
+                    SQL("(%s, %s::date, %s::numeric)", target_id, day, amount)
+                    for (target_id, day), amount in daily.items()
+                ),
+            ) if daily else SQL("SELECT NULL::int AS target_id, NULL::date AS day, 0::numeric AS amount"
+                                " WHERE FALSE"))
+
+    @api.model
+    def _upsert_history(self, targets, daily):
+        """Upsert one row per day of the periods of ``targets`` up to today,
+        accumulating ``daily``, a ``(target_id, day, amount)`` query."""
+        today = fields.Date.context_today(self)
+        history = SQL(
+            """
+            CROSS JOIN LATERAL generate_series(
+                t.start_date::timestamp, LEAST(t.end_date, %(today)s::date)::timestamp, interval '1 day'
+            ) AS days(day)
+            LEFT JOIN (%(daily)s) daily ON daily.target_id = t.id AND daily.day = days.day::date
+            """,
+            today=today,
+            daily=daily,
+        )
+        achievement = SQL(
+            "SUM(COALESCE(daily.amount, 0)) OVER (PARTITION BY t.id ORDER BY days.day)")
+        self._upsert(targets, self._get_select(
+            targets, SQL("days.day::date"), achievement,
+            SQL("t.id IN %s", tuple(targets.ids)), extra_from=history,
+        ))
+
+    @api.model
+    def _get_rollup_targets(self, targets):
+        """Team targets of ``targets`` rolled up from their members."""
+        if targets._name != 'sales.team.target':
+            return targets.browse()
+        return targets.filtered(lambda target: target.achievement_source == 'members')
+
+    @api.model
+    def _get_ledger_daily(self, targets):
+        """Daily ledger sums of ``targets``, as a ``(target_id, day, amount)`` query.
+
+        Deferred rows still pending are left out, like from the achievement
+        of the targets until the cron applies them.
+        """
+        column = SQL.identifier(targets._ledger_target_field)
+        return SQL(
+            """
+            SELECT l.%(column)s AS target_id,
+                   GREATEST(LEAST(l.date, lt.end_date), lt.start_date) AS day,
+                   SUM(l.amount) AS amount
+              FROM sales_target_achievement_line l
+              JOIN %(target_table)s lt ON lt.id = l.%(column)s
+             WHERE l.%(column)s IN %(ids)s
+               AND l.pending IS NOT TRUE
+             GROUP BY 1, 2
+            """,
+            column=column,
+            target_table=SQL.identifier(targets._table),
+            ids=tuple(targets.ids),
+        )
+
+    @api.model
+    def _get_daily_amounts(self, targets):
+        """Daily achievement of ``targets`` as ``{(target id, day): amount}``,
+        in the currency of each target."""
+        daily = defaultdict(float)
+        rollup = self._get_rollup_targets(targets)
+        dimensional = (targets - rollup).filtered(lambda target: target.dimension != 'none')
+        ledger_targets = targets - rollup - dimensional
+        if ledger_targets:
+            self.env['sales.target.achievement.line'].flush_model()
+            self.env.cr.execute(self._get_ledger_daily(ledger_targets))
+            for target_id, day, amount in self.env.cr.fetchall():
+                daily[target_id, day] += amount
+        if dimensional:
+            dimensional.flush_recordset()
+            self.env['sales.target.fact'].flush_model()
+            self.env.cr.execute(SQL(
+                """
+                SELECT t.id, f.currency_id, t.currency_id, f.company_id, f.date, SUM(f.amount)
+                  FROM %(table)s t
+                  JOIN sales_target_fact f ON f.%(owner)s = t.%(owner)s
+                                          AND f.target_point = t.target_point
+                                          AND f.date BETWEEN t.start_date AND t.end_date
+                                          AND (f.company_id = t.company_id OR t.company_id IS NULL)
+                 WHERE t.id IN %(ids)s AND %(condition)s
+                 GROUP BY 1, 2, 3, 4, 5
+                """,
+                table=SQL.identifier(targets._table),
+                owner=SQL.identifier(targets._target_owner_field),
+                ids=tuple(dimensional.ids),
+                condition=targets._get_fact_condition('f'),
+            ))
+            groups = self.env.cr.fetchall()
+            for (target_id, __, __, __, day, __), amount in zip(
+                groups, targets._convert_amount_groups([group[1:] for group in groups])
+            ):
+                daily[target_id, day] += amount
+        if rollup:
+            # Member histories converted like _get_member_totals, at today's rate
+            self.env['sales.target'].flush_model()
+            rollup.flush_recordset()
+            self.env.cr.execute(SQL(
+                """
+                SELECT tt.id, p.id, p.currency_id, tt.currency_id, tt.company_id
+                  FROM sales_team_target tt
+                  %(join)s
+                 WHERE tt.id IN %(ids)s AND p.state != 'draft'
+                """,
+                join=rollup._get_rollup_join(),
+                ids=tuple(rollup.ids),
+            ))
+            members = defaultdict(list)
+            for target_id, member_id, from_currency_id, to_currency_id, company_id in self.env.cr.fetchall():
+                members[member_id].append((target_id, from_currency_id, to_currency_id, company_id))
+            member_daily = self._get_daily_amounts(self.env['sales.target'].browse(list(members)))
+            groups = [
+                (amount, from_currency_id, to_currency_id, company_id, None, target_id, day)
+                for (member_id, day), amount in member_daily.items()
+                for target_id, from_currency_id, to_currency_id, company_id in members[member_id]
+            ]
+            for group, amount in zip(groups, rollup._convert_amount_groups([group[:5] for group in groups])):
+                daily[group[5], group[6]] += amount
+        return daily
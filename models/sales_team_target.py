@@ -1,14 +1,34 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
-from datetime import date
+from odoo.tools import SQL
 
 class SalesTeamTarget(models.Model):
     _name = "sales.team.target"
     _description = "Sales Team Sales Target"
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'sales.target.mixin']
+
+    _target_owner_field = 'team_id'
+    _target_achievement_field = 'achievement'
+    _ledger_target_field = 'sales_team_target_id'
+    _document_owner_columns = {'sale.order': 'team_id', 'account.move': 'team_id'}
+    _target_amount_field = 'target'
+    _target_theoretical_field = 'theoretical_achievement'
+    _target_percent_field = 'achievement_percentage'
+    _target_mail_template = 'sales_target_omax.email_template_sales_team_target'
+    _target_sequence_code = 'sales.team.target'
 
-    name = fields.Char(string="Reference", required=True, copy=False, readonly=True,
-        default=lambda self: self.env['ir.sequence'].next_by_code('sales.team.target'))
+    _sql_constraints = [
+        ('team_period_exclusion',
+         "EXCLUDE USING gist (team_id WITH =, target_point WITH =, dimension WITH =, "
+         "(COALESCE(product_categ_id, 0)) WITH =, (COALESCE(product_id, 0)) WITH =, "
+         "daterange(start_date, end_date, '[]') WITH &&)",
+         "A Sales Team Target already exists for this team with the same Target Point and dimension "
+         "in this date range!"),
+    ]
+
+    name = fields.Char(string="Reference", required=True, copy=False, readonly=True, default="New")
 
     team_id = fields.Many2one('crm.team', string="Sales Team", required=True)
     start_date = fields.Date(string="Start Date", required=True)
@@ -32,19 +52,29 @@ class SalesTeamTarget(models.Model):
     achievement_percentage = fields.Float(string="Achievement Percentage", compute="_compute_percentage", store=True)
 
     # Theoretical
-    theoretical_achievement = fields.Float(string="Theoretical Achievement")
-    theoretical_percentage = fields.Float(string="Theoretical Achievement Percentage")
+    theoretical_achievement = fields.Float(string="Theoretical Achievement",
+                                           compute="_compute_theoretical", store=True)
+    theoretical_percentage = fields.Float(string="Theoretical Achievement Percentage",
+                                          compute="_compute_theoretical", store=True)
     theoretical_status = fields.Selection([
         ('completed', 'Completed'),
         ('in_progress', 'In Progress'),
         ('failed', 'Failed'),
-    ], string="Theoretical Achievement Status", default="in_progress")
+    ], string="Theoretical Achievement Status", default="in_progress",
+        compute="_compute_theoretical", store=True, index=True)
 
     state = fields.Selection([
         ('draft', 'Draft'),
         ('open', 'Open'),
         ('closed', 'Closed'),
     ], string="Status", default="draft", tracking=True)
+    achievement_source = fields.Selection([
+        ('documents', 'Sale Orders / Invoices'),
+        ('members', 'Member Targets'),
+    ], string="Achievement Source", default='documents', required=True, tracking=True,
+        help="Member Targets: roll up the achievements of the team members' salesperson "
+             "targets with the same target point and a period within this one, "
+             "instead of scanning the team's orders and invoices again.")
 
     order_ids = fields.One2many(
         'sale.order',
@@ -70,83 +100,23 @@ class SalesTeamTarget(models.Model):
         store=False,
         currency_field="currency_id"
     )
-    @api.depends('order_ids', 'order_ids.amount_total')
-    def _compute_sale_total(self):
-        for rec in self:
-            rec.sale_total = sum(rec.order_ids.mapped('amount_total'))
-    @api.depends('invoice_ids.amount_total')
-    def _compute_invoice_total(self):
-        for rec in self:
-            rec.invoice_total = sum(rec.invoice_ids.mapped('amount_total'))
+    order_count = fields.Integer(string="Orders", compute="_compute_document_counts")
+    invoice_count = fields.Integer(string="Invoices", compute="_compute_document_counts")
+    achievement_line_ids = fields.One2many(
+        'sales.target.achievement.line',
+        'sales_team_target_id',
+        string="Achievement Ledger",
+        readonly=True
+    )
+
+    # Frozen by action_close
+    closed_sale_total = fields.Monetary(string="Final Total Sales", currency_field="currency_id",
+                                        readonly=True, copy=False)
+    closed_invoice_total = fields.Monetary(string="Final Total Invoice", currency_field="currency_id",
+                                           readonly=True, copy=False)
+    closed_order_count = fields.Integer(string="Final Order Count", readonly=True, copy=False)
+    closed_invoice_count = fields.Integer(string="Final Invoice Count", readonly=True, copy=False)
 
-    @api.depends('target_point', 'team_id', 'start_date', 'end_date')
-    def _compute_invoice_ids(self):
-        for rec in self:
-            if not (rec.team_id and rec.start_date and rec.end_date):
-                rec.invoice_ids = False
-                continue
-            domain = [
-                ('team_id', '=', rec.team_id.id),  # cần chắc chắn account.move có field team_id
-                ('invoice_date', '>=', rec.start_date),
-                ('invoice_date', '<=', rec.end_date),
-                ('move_type', '=', 'out_invoice'),
-                ('state', '=', 'posted'),
-            ]
-            if rec.target_point == 'invoice_validation':
-                domain.append(('payment_state', '!=', 'paid'))
-            elif rec.target_point == 'invoice_paid':
-                domain.append(('payment_state', '=', 'paid'))
-            rec.invoice_ids = self.env['account.move'].search(domain)
-
-
-    @api.constrains('team_id', 'start_date', 'end_date', 'target_point')
-    def _check_unique_team_date_targetpoint(self):
-        for rec in self:
-            conflict = self.search([
-                ('id', '!=', rec.id),
-                ('team_id', '=', rec.team_id.id),
-                ('target_point', '=', rec.target_point),
-                ('start_date', '<=', rec.end_date),
-                ('end_date', '>=', rec.start_date),
-            ], limit=1)
-            if conflict:
-                raise ValidationError((
-                    "A Sales Team Target already exists for team '%s' with Target Point '%s' in this date range!"
-                ) % (rec.team_id.name, rec.target_point))
-
-    @api.depends('target')
-    def _compute_achievement(self):
-        """Tự cộng achievement từ sale.order hoặc invoice theo target_point"""
-        for rec in self:
-            achievement = 0.0
-            if rec.target_point == 'so_confirm':
-                orders = self.env['sale.order'].search([
-                    ('team_id', '=', rec.team_id.id),
-                    ('date_order', '>=', rec.start_date),
-                    ('date_order', '<=', rec.end_date),
-                    ('state', 'in', ['sale', 'done']),
-                ])
-                achievement = sum(orders.mapped('amount_total'))
-            elif rec.target_point == 'invoice_paid':
-                invoices = self.env['account.move'].search([
-                    ('invoice_date', '>=', rec.start_date),
-                    ('invoice_date', '<=', rec.end_date),
-                    ('team_id', '=', rec.team_id.id),
-                    ('move_type', '=', 'out_invoice'),
-                    ('payment_state', '=', 'paid'),
-                ])
-                achievement = sum(invoices.mapped('amount_total'))
-
-            elif rec.target_point == 'invoice_amount':
-                invoices = self.env['account.move'].search([
-                    ('invoice_date', '>=', rec.start_date),
-                    ('invoice_date', '<=', rec.end_date),
-                    ('team_id', '=', rec.team_id.id),
-                    ('move_type', '=', 'out_invoice'),
-                    ('state', '=', 'posted'),
-                ])
-                achievement = sum(invoices.mapped('amount_total'))
-            rec.achievement = achievement
     @api.depends('target', 'achievement')
     def _compute_difference(self):
         for rec in self:
@@ -160,10 +130,13 @@ class SalesTeamTarget(models.Model):
             else:
                 rec.achievement_percentage = 0
 
-    @api.depends('target', 'start_date', 'end_date')
+    @api.depends('target', 'start_date', 'end_date', 'achievement')
     def _compute_theoretical(self):
-        """Tính Theoretical achievement theo ngày hiện tại"""
-        today = date.today()
+        """Tính Theoretical achievement theo ngày hiện tại
+
+        Stored; :meth:`_cron_refresh_theoretical` moves it forward every day.
+        """
+        today = fields.Date.context_today(self)
         for rec in self:
             if not rec.start_date or not rec.end_date or not rec.target:
                 rec.theoretical_achievement = 0
@@ -183,41 +156,212 @@ class SalesTeamTarget(models.Model):
                 rec.theoretical_percentage = 100
                 rec.theoretical_status = 'completed'
 
-    def _update_achievement(self, record, point_type):
-        """Cập nhật achievement khi có Sale Order hoặc Invoice."""
-        date_field = getattr(record, 'date_order', getattr(record, 'invoice_date', False))
-        team_field = getattr(record, 'team_id', False)
-        amount = getattr(record, 'amount_total', 0)
+    @api.model
+    def _get_document_owner(self, document):
+        return document.team_id
 
-        if not date_field or not team_field:
-            return
+    @api.model
+    def _get_theoretical_sql_vals(self, today, achievement):
+        """Same as :meth:`_compute_theoretical`, as SQL assignments."""
+        has_target = SQL("COALESCE(t.target, 0) != 0")
+        in_period = SQL("%s::date BETWEEN t.start_date AND t.end_date", today)
+        total_days = SQL("(t.end_date - t.start_date + 1)")
+        current_day = SQL("(%s::date - t.start_date + 1)", today)
+        theoretical = SQL(
+            "CASE WHEN NOT %s THEN 0 WHEN %s THEN t.target / %s * %s ELSE t.target END",
+            has_target, in_period, total_days, current_day)
+        return {
+            'theoretical_achievement': theoretical,
+            'theoretical_percentage': SQL(
+                "CASE WHEN NOT %s THEN 0 WHEN %s THEN %s * 100.0 / %s ELSE 100 END",
+                has_target, in_period, current_day, total_days),
+            'theoretical_status': SQL(
+                "CASE WHEN NOT %s THEN 'in_progress' WHEN NOT %s THEN 'completed'"
+                " WHEN (%s) >= %s THEN 'completed' ELSE 'in_progress' END",
+                has_target, in_period, achievement, theoretical),
+        }
 
-        targets = self.search([
-            ('team_id', '=', team_field.id),
-            ('target_point', '=', point_type),
-            ('start_date', '<=', date_field),
-            ('end_date', '>=', date_field),
-            ('state', '=', 'open')
+    @api.model
+    def _get_achievement_sql_vals(self, amount):
+        return {
+            'difference': SQL("(%s) - COALESCE(t.target, 0)", amount),
+            'achievement_percentage': SQL(
+                "CASE WHEN t.target > 0 THEN (%s) * 100 / t.target ELSE 0 END", amount),
+        }
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Reference given on save, one reservation per company for the whole
+        # batch, so discarded drafts no longer consume sequence numbers
+        unnamed = defaultdict(list)
+        for vals in vals_list:
+            if vals.get('name', "New") == "New":
+                unnamed[vals.get('company_id') or self.env.company.id].append(vals)
+        for company_id, company_vals in unnamed.items():
+            names = self._reserve_names(len(company_vals), self.env['res.company'].browse(company_id))
+            for vals, name in zip(company_vals, names):
+                vals['name'] = name
+        return super().create(vals_list)
+
+    # ======================
+    # MEMBER ROLLUP
+    # ======================
+    def write(self, vals):
+        res = super().write(vals)
+        if 'achievement_source' in vals:
+            self.filtered(lambda target: target.state == 'open').sudo()._recompute_achievement()
+        return res
+
+    def _get_rollup_join(self):
+        """Join of rollup team targets ``tt`` to the salesperson targets ``p``
+        of their members, measured on the same dimension."""
+        return SQL(
+            """
+            JOIN crm_team_member m ON m.crm_team_id = tt.team_id AND m.active
+            JOIN sales_target p ON p.salesperson_id = m.user_id
+                               AND p.target_point = tt.target_point
+                               AND p.start_date >= tt.start_date
+                               AND p.end_date <= tt.end_date
+                               AND (p.company_id = tt.company_id OR p.company_id IS NULL)
+                               AND p.dimension = tt.dimension
+                               AND p.product_categ_id IS NOT DISTINCT FROM tt.product_categ_id
+                               AND p.product_id IS NOT DISTINCT FROM tt.product_id
+            """
+        )
+
+    def _get_member_totals(self):
+        """Achievement of rollup targets from their member targets, with one
+        aggregate over ``sales.target``, in the currency of each target."""
+        if not self:
+            return {}
+        self.env['sales.target'].flush_model()
+        self.flush_recordset()
+        self.env.cr.execute(SQL(
+            """
+            SELECT tt.id, p.currency_id, tt.currency_id, tt.company_id,
+                   COALESCE(SUM(p.achievement_amount), 0)
+              FROM sales_team_target tt
+              %(join)s
+             WHERE tt.id IN %(ids)s AND p.state != 'draft'
+             GROUP BY tt.id, p.currency_id
+            """,
+            join=self._get_rollup_join(),
+            ids=tuple(self.ids),
+        ))
+        groups = self.env.cr.fetchall()
+        amounts = self._convert_amount_groups([
+            (amount, from_currency_id, to_currency_id, company_id, None)
+            for __, from_currency_id, to_currency_id, company_id, amount in groups
         ])
+        totals = dict.fromkeys(self.ids, 0.0)
+        for (target_id, *__), amount in zip(groups, amounts):
+            totals[target_id] += amount
+        return totals
+
+    @api.model
+    def _get_rollup_targets(self, member_target_ids):
+        """Open rollup team targets of salesperson targets, as
+        ``{salesperson target id: [(team target id, currency id, company id)]}``."""
+        if not member_target_ids:
+            return {}
+        self.flush_model(['team_id', 'target_point', 'start_date', 'end_date', 'company_id',
+                          'state', 'achievement_source', 'dimension', 'product_categ_id', 'product_id'])
+        self.env['sales.target'].flush_model(['salesperson_id', 'target_point', 'start_date',
+                                              'end_date', 'company_id', 'dimension',
+                                              'product_categ_id', 'product_id'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT p.id, tt.id, tt.currency_id, tt.company_id
+              FROM sales_team_target tt
+              %(join)s
+             WHERE p.id IN %(ids)s
+               AND tt.state = 'open'
+               AND tt.achievement_source = 'members'
+            """,
+            join=self._get_rollup_join(),
+            ids=tuple(member_target_ids),
+        ))
+        result = defaultdict(list)
+        for member_target_id, target_id, currency_id, company_id in self.env.cr.fetchall():
+            result[member_target_id].append((target_id, currency_id, company_id))
+        return result
+
+    @api.model
+    def _rollup_member_increments(self, member_targets, amounts):
+        """Add increments of salesperson targets to their rollup team targets.
+
+        ``amounts`` is ``{salesperson target id: increment}``; every team
+        target is incremented once, atomically, by the sum of its members'.
+        """
+        rollups = self._get_rollup_targets(list(amounts))
+        if not rollups:
+            return
+        currencies = {target.id: target.currency_id.id for target in member_targets}
+        groups = [
+            (amounts[member_id], currencies.get(member_id), currency_id, company_id, None, target_id)
+            for member_id, targets in rollups.items()
+            for target_id, currency_id, company_id in targets
+        ]
+        increments = defaultdict(float)
+        for group, amount in zip(groups, self._convert_amount_groups([group[:5] for group in groups])):
+            increments[group[5]] += amount
+        self._add_achievement(increments)
+
+    @api.model
+    def _refresh_member_rollup(self, member_target_ids):
+        """Reset the rollup team targets of salesperson targets from their members."""
+        rollups = self._get_rollup_targets(member_target_ids)
+        targets = self.browse({target_id for targets in rollups.values() for target_id, *__ in targets})
+        targets._set_achievement(targets._get_member_totals())
+
+    @api.model
+    def _update_achievement(self, records, point_type, matches=None):
+        # Rollup targets only follow their members, never documents directly
+        if matches is None:
+            matches = self._find_open_targets(records, point_type)
+        targets = self.browse({target.id for target in matches.values()})
+        rollup_ids = set(targets.filtered(lambda target: target.achievement_source == 'members').ids)
+        matches = {doc_id: target for doc_id, target in matches.items() if target.id not in rollup_ids}
+        return super()._update_achievement(records, point_type, matches=matches)
+
+    @api.model
+    def _get_fact_condition(self, alias):
+        # Rollup targets only follow their members, never the facts directly
+        return SQL("(%s) AND t.achievement_source != 'members'", super()._get_fact_condition(alias))
+
+    def _recompute_achievement(self):
+        rollup = self.filtered(lambda target: target.achievement_source == 'members')
+        super(SalesTeamTarget, self - rollup)._recompute_achievement()
+        rollup._set_achievement(rollup._get_member_totals())
+
+    def _rebuild_achievement(self):
+        rollup = self.filtered(lambda target: target.achievement_source == 'members')
+        super(SalesTeamTarget, self - rollup)._rebuild_achievement()
+        rollup._set_achievement(rollup._get_member_totals())
 
-        for target in targets:
-            new_amount = target.achievement + amount
-            target.write({
-                'achievement': new_amount,
-                'difference': new_amount - target.target,
-                'achievement_percentage': (new_amount / target.target * 100) if target.target else 0,
-            })
     def action_confirm(self):
         for record in self:
             if not record.start_date or not record.end_date or not record.target:
                 raise ValidationError("Start Date, End Date, and Target are required to confirm!")
-            record.state = 'open'
+        self.write({'state': 'open'})
+        rollup = self.filtered(lambda target: target.achievement_source == 'members')
+        rollup._set_achievement(rollup._get_member_totals())
+
+    @api.model
+    def _prepare_generated_vals(self, owner, target_point, amount, start_date, end_date, company, source=None):
+        vals = super()._prepare_generated_vals(owner, target_point, amount, start_date, end_date, company, source)
+        vals.update({
+            'user_id': (source.user_id if source else owner.user_id).id,
+            'achievement_source': source.achievement_source if source else 'documents',
+        })
+        return vals
 
     def action_close(self):
         for record in self:
             if record.state != 'open':
                 raise ValidationError("Can only close an Open target!")
-            record.state = 'closed'
+        self._freeze()
+        self.write({'state': 'closed'})
 
     def action_set_draft(self):
         for record in self:
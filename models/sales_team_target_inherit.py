@@ -1,93 +1,120 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+
 from odoo import models, fields, api
 
+from .sales_target_profiler import profiled
+
 class AccountMove(models.Model):
     _inherit = 'account.move'
 
-    sales_team_target_id = fields.Many2one('sales.team.target', string="Sales Team Target")
+    sales_team_target_id = fields.Many2one('sales.team.target', string="Sales Team Target", index='btree_not_null')
 
-    @api.model
-    def create(self, vals):
-        inv = super(AccountMove, self).create(vals)
-        inv._assign_sales_team_target()
-        return inv
+    @api.model_create_multi
+    def create(self, vals_list):
+        invs = super(AccountMove, self).create(vals_list)
+        invs._assign_sales_team_target()
+        return invs
 
     def write(self, vals):
+        tracked = any(f in vals for f in ('invoice_date', 'invoice_origin', 'company_id'))
+        before = {rec.id: rec._get_sales_team_target_key() for rec in self} if tracked else {}
         res = super(AccountMove, self).write(vals)
-        if any(f in vals for f in ('invoice_date', 'invoice_user_id', 'payment_state', 'invoice_origin', 'state')):
-            for rec in self:
-                rec._assign_sales_team_target()
+        if tracked:
+            # Chỉ gán lại các hóa đơn có origin, ngày hoặc target point thực sự thay đổi
+            self.filtered(lambda rec: rec._get_sales_team_target_key() != before[rec.id])._assign_sales_team_target()
         return res
 
+    def _record_sales_target_payment(self):
+        # Paid invoices move to the invoice_paid target, and back when unpaid
+        super()._record_sales_target_payment()
+        self._assign_sales_team_target()
+        self.env['sales.team.target'].sudo()._update_achievement(self, 'invoice_paid')
+
+    def _reverse_sales_target_payment(self):
+        super()._reverse_sales_target_payment()
+        self._assign_sales_team_target()
+        self.env['sales.team.target'].sudo()._reverse_achievement(self, ['invoice_paid'])
+
+    # Team invoice achievements follow the sales team of the invoice, like
+    # the aggregates of the recompute
+
+    @profiled('account.move.action_post (team)')
     def action_post(self):
         res = super(AccountMove, self).action_post()
-        for inv in self:
-            inv._assign_sales_team_target()
+        self._assign_sales_team_target()
+        invoices = self._get_sales_target_documents()
+        self.env['sales.team.target'].sudo()._update_achievement(invoices, 'invoice_validation')
+        return res
+
+    @profiled('account.move.button_draft (team)')
+    def button_draft(self):
+        res = super(AccountMove, self).button_draft()
+        self.env['sales.team.target'].sudo()._reverse_achievement(
+            self._get_sales_target_documents(), ['invoice_validation', 'invoice_paid'])
         return res
 
+    @profiled('account.move.button_cancel (team)')
+    def button_cancel(self):
+        res = super(AccountMove, self).button_cancel()
+        self.env['sales.team.target'].sudo()._reverse_achievement(
+            self._get_sales_target_documents(), ['invoice_validation', 'invoice_paid'])
+        return res
+
+    def _get_sales_team_target_key(self):
+        """Values deciding which sales.team.target an invoice belongs to."""
+        self.ensure_one()
+        return (self.invoice_origin, self.invoice_date, self.company_id.id)
+
+    @profiled('_assign_sales_team_target')
     def _assign_sales_team_target(self):
-        """Gán sales_team_target dựa trên invoice_origin -> sale.order -> team_id"""
+        """Gán sales_team_target dựa trên invoice_origin -> sale.order -> team_id
+
+        The whole batch is resolved in one pass: one lookup of the origin
+        orders, cached target periods, and one write per resulting target.
+        """
+        if not self:
+            return
+        targets = self.env['sales.team.target'].sudo()
+        origins = {inv.invoice_origin for inv in self if inv.invoice_origin}
+        team_by_origin = {}
+        if origins:
+            for so in self.env['sale.order'].search([('name', 'in', list(origins))]):
+                team_by_origin.setdefault(so.name, so.team_id)
+        owners = {inv.id: team_by_origin.get(inv.invoice_origin) for inv in self}
+
+        # Paid invoices go to the invoice_paid target if any, else to the invoice_validation one
+        matches = targets._find_open_targets(
+            self.filtered(lambda inv: inv.payment_state == 'paid'), 'invoice_paid', owners=owners)
+        matches.update(targets._find_open_targets(
+            self.filtered(lambda inv: inv.id not in matches), 'invoice_validation', owners=owners))
+
+        groups = defaultdict(list)
         for inv in self:
-            assigned = False
-            if inv.invoice_origin:
-                so = self.env['sale.order'].search([('name', '=', inv.invoice_origin)], limit=1)
-                if so and so.team_id:
-                    point = 'invoice_paid' if inv.payment_state == 'paid' else 'invoice_validation'
-                    target = self.env['sales.team.target'].search([
-                        ('team_id', '=', so.team_id.id),
-                        ('state', '=', 'open'),
-                        ('start_date', '<=', inv.invoice_date),
-                        ('end_date', '>=', inv.invoice_date),
-                        ('target_point', '=', point),
-                    ], limit=1)
-                    if target:
-                        inv.sales_team_target_id = target.id
-                        assigned = True
-            if not assigned:
-                inv.sales_team_target_id = False
+            target_id = matches[inv.id].id if inv.id in matches else False
+            if inv.sales_team_target_id.id != target_id:
+                groups[target_id].append(inv.id)
+        for target_id, inv_ids in groups.items():
+            self.browse(inv_ids).write({'sales_team_target_id': target_id})
 
 
 class SaleOrder(models.Model):
     _inherit = "sale.order"
 
-    sales_team_target_id = fields.Many2one('sales.team.target', string="Sales Team Target")
+    sales_team_target_id = fields.Many2one('sales.team.target', string="Sales Team Target", index='btree_not_null')
 
+    @profiled('sale.order.action_confirm (team)')
     def action_confirm(self, *args, **kwargs):
         res = super(SaleOrder, self).action_confirm(*args, **kwargs)
-        for order in self:
-            # Gán target nếu chưa có
-            if not order.sales_team_target_id and order.team_id and order.date_order:
-                target = self.env['sales.team.target'].search([
-                    ('team_id', '=', order.team_id.id),
-                    ('state', '=', 'open'),
-                    ('start_date', '<=', order.date_order),
-                    ('end_date', '>=', order.date_order),
-                    ('target_point', '=', 'so_confirm'),
-                ], limit=1)
-                if target:
-                    order.sales_team_target_id = target.id
-
-            # Cập nhật achievement
-            self.env['sales.team.target'].sudo()._update_achievement(order, 'so_confirm')
+        # Confirming resets date_order: link the whole batch on the new date
+        targets = self.env['sales.team.target'].sudo()
+        matches = targets._find_open_targets(self, 'so_confirm')
+        targets._link_documents(self, 'sales_team_target_id', matches, overwrite=True)
+        targets._update_achievement(self, 'so_confirm', matches=matches)
         return res
 
-
-    @api.model
-    def action_confirm(self):
-        res = super().action_confirm()
-        for order in self:
-            # Gán target nếu chưa có
-            if not order.sales_team_target_id and order.team_id and order.date_order:
-                target = self.env['sales.team.target'].search([
-                    ('team_id', '=', order.team_id.id),
-                    ('state', '=', 'open'),
-                    ('start_date', '<=', order.date_order),
-                    ('end_date', '>=', order.date_order),
-                    ('target_point', '=', 'so_confirm'),
-                ], limit=1)
-                if target:
-                    order.sales_team_target_id = target.id
-
-            # Cập nhật achievement
-            self.env['sales.team.target'].sudo()._update_achievement(order, 'so_confirm')
+    @profiled('sale.order._action_cancel (team)')
+    def _action_cancel(self):
+        res = super(SaleOrder, self)._action_cancel()
+        self.env['sales.team.target'].sudo()._reverse_achievement(self, ['so_confirm'])
         return res
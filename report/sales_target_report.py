@@ -0,0 +1,174 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+# Report row ids are target_key * REPORT_DAYS_PER_KEY + days since REPORT_EPOCH;
+# target_key is twice the target id, plus one for team targets, so ids are
+# positive and unique across both target models
+REPORT_DAYS_PER_KEY = 100000
+REPORT_EPOCH = '1900-01-01'
+
+
+class SalesTargetReport(models.Model):
+    _name = "sales.target.report"
+    _description = "Sales Target Analysis"
+    _auto = False
+    _order = "date desc"
+    _rec_name = "date"
+
+    date = fields.Date(string="Date", readonly=True)
+    target_type = fields.Selection([
+        ('salesperson', 'Salesperson Target'),
+        ('team', 'Sales Team Target'),
+    ], string="Target Type", readonly=True)
+    sales_target_id = fields.Many2one('sales.target', string="Salesperson Target", readonly=True)
+    sales_team_target_id = fields.Many2one('sales.team.target', string="Sales Team Target", readonly=True)
+    salesperson_id = fields.Many2one('res.users', string="Salesperson", readonly=True)
+    team_id = fields.Many2one('crm.team', string="Sales Team", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", readonly=True)
+    target_point = fields.Selection([
+        ('so_confirm', 'Sale Order Confirm'),
+        ('invoice_validation', 'Invoice Validation'),
+        ('invoice_paid', 'Invoice Paid'),
+    ], string="Target Point", readonly=True)
+    state = fields.Selection([
+        ('draft', "Draft"),
+        ('open', "Open"),
+        ('closed', "Closed"),
+    ], string="Status", readonly=True)
+
+    target_amount = fields.Monetary(
+        string="Target", currency_field="currency_id", readonly=True,
+        help="Target spread evenly over the days of its period.")
+    achievement = fields.Monetary(
+        string="Achievement", currency_field="currency_id", readonly=True,
+        help="Amount of the day counted for the target point of the target.")
+    sale_amount = fields.Monetary(string="Sales", currency_field="currency_id", readonly=True)
+    sale_count = fields.Integer(string="Orders", readonly=True)
+    invoice_amount = fields.Monetary(string="Invoiced", currency_field="currency_id", readonly=True)
+    paid_amount = fields.Monetary(string="Paid", currency_field="currency_id", readonly=True)
+    invoice_count = fields.Integer(string="Invoices", readonly=True)
+
+    def _get_totals_query(self, daily, target_type, owner):
+        """Daily amounts of ``daily`` summed per target of ``target_type``,
+        matched on ``owner``, period and company."""
+        return SQL(
+            """
+            SELECT tg.target_key, x.date, SUM(x.amount) AS amount, SUM(x.paid_amount) AS paid_amount,
+                   SUM(x.count) AS count
+              FROM targets tg
+              JOIN %(daily)s x ON x.%(owner)s = tg.%(owner)s
+                              AND x.date BETWEEN tg.start_date AND tg.end_date
+                              AND (x.company_id = tg.company_id OR tg.company_id IS NULL)
+             WHERE tg.target_type = %(target_type)s
+             GROUP BY 1, 2
+            """,
+            daily=SQL.identifier(daily),
+            owner=SQL.identifier(owner),
+            target_type=target_type,
+        )
+
+    def _query(self):
+        """One row per whole-document target and day of its period.
+
+        Orders and invoices are first summed per owner, company and day, so
+        the targets are joined with pre-aggregated days instead of documents.
+        Amounts are in the company currency. Row ids derive from the target
+        and the day, so they stay the same across refreshes.
+        """
+        return SQL(
+            """
+            WITH daily_orders AS (
+                SELECT o.user_id AS salesperson_id, o.team_id, o.company_id, o.date_order::date AS date,
+                       SUM(o.amount_total / COALESCE(NULLIF(o.currency_rate, 0), 1)) AS amount,
+                       0 AS paid_amount,
+                       COUNT(*) AS count
+                  FROM sale_order o
+                 WHERE o.state IN ('sale', 'done')
+                 GROUP BY 1, 2, 3, 4
+            ),
+            daily_invoices AS (
+                SELECT m.invoice_user_id AS salesperson_id, m.team_id, m.company_id, m.invoice_date AS date,
+                       SUM(m.amount_total_signed) AS amount,
+                       COALESCE(SUM(m.amount_total_signed) FILTER (WHERE m.payment_state = 'paid'), 0)
+                           AS paid_amount,
+                       COUNT(*) AS count
+                  FROM account_move m
+                 WHERE m.move_type IN ('out_invoice', 'out_refund')
+                   AND m.state = 'posted'
+                   AND m.invoice_date IS NOT NULL
+                 GROUP BY 1, 2, 3, 4
+            ),
+            targets AS (
+                SELECT 2 * t.id::bigint AS target_key, 'salesperson' AS target_type,
+                       t.id AS sales_target_id, NULL::int AS sales_team_target_id,
+                       t.salesperson_id, u.sale_team_id AS team_id, t.company_id, t.currency_id,
+                       t.target_point, t.state, t.start_date, t.end_date,
+                       COALESCE(t.target_amount, 0) AS target_amount
+                  FROM sales_target t
+                  JOIN res_users u ON u.id = t.salesperson_id
+                 WHERE t.dimension = 'none' AND t.start_date <= t.end_date
+                 UNION ALL
+                SELECT 2 * t.id::bigint + 1, 'team', NULL, t.id, NULL, t.team_id, t.company_id, t.currency_id,
+                       t.target_point, t.state, t.start_date, t.end_date, COALESCE(t.target, 0)
+                  FROM sales_team_target t
+                 WHERE t.dimension = 'none' AND t.start_date <= t.end_date
+            ),
+            order_totals AS (
+                %(salesperson_orders)s
+                 UNION ALL
+                %(team_orders)s
+            ),
+            invoice_totals AS (
+                %(salesperson_invoices)s
+                 UNION ALL
+                %(team_invoices)s
+            )
+            SELECT tg.target_key * %(days_per_key)s + (days.day::date - %(epoch)s::date) AS id,
+                   days.day::date AS date,
+                   tg.target_type, tg.sales_target_id, tg.sales_team_target_id,
+                   tg.salesperson_id, tg.team_id, tg.company_id,
+                   COALESCE(c.currency_id, tg.currency_id) AS currency_id,
+                   tg.target_point, tg.state,
+                   tg.target_amount / (tg.end_date - tg.start_date + 1) AS target_amount,
+                   CASE tg.target_point
+                        WHEN 'so_confirm' THEN COALESCE(ot.amount, 0)
+                        WHEN 'invoice_paid' THEN COALESCE(it.paid_amount, 0)
+                        ELSE COALESCE(it.amount, 0)
+                   END AS achievement,
+                   COALESCE(ot.amount, 0) AS sale_amount,
+                   COALESCE(ot.count, 0) AS sale_count,
+                   COALESCE(it.amount, 0) AS invoice_amount,
+                   COALESCE(it.paid_amount, 0) AS paid_amount,
+                   COALESCE(it.count, 0) AS invoice_count
+              FROM targets tg
+             CROSS JOIN LATERAL generate_series(
+                   tg.start_date::timestamp, tg.end_date::timestamp, interval '1 day') AS days(day)
+              LEFT JOIN res_company c ON c.id = tg.company_id
+              LEFT JOIN order_totals ot ON ot.target_key = tg.target_key AND ot.date = days.day::date
+              LEFT JOIN invoice_totals it ON it.target_key = tg.target_key AND it.date = days.day::date
+            """,
+            salesperson_orders=self._get_totals_query('daily_orders', 'salesperson', 'salesperson_id'),
+            team_orders=self._get_totals_query('daily_orders', 'team', 'team_id'),
+            salesperson_invoices=self._get_totals_query('daily_invoices', 'salesperson', 'salesperson_id'),
+            team_invoices=self._get_totals_query('daily_invoices', 'team', 'team_id'),
+            days_per_key=REPORT_DAYS_PER_KEY,
+            epoch=REPORT_EPOCH,
+        )
+
+    def init(self):
+        table = SQL.identifier(self._table)
+        self.env.cr.execute(SQL("DROP MATERIALIZED VIEW IF EXISTS %s", table))
+        self.env.cr.execute(SQL("CREATE MATERIALIZED VIEW %s AS (%s)", table, self._query()))
+        # REFRESH ... CONCURRENTLY needs a unique index
+        self.env.cr.execute(SQL(
+            "CREATE UNIQUE INDEX %s ON %s (id)", SQL.identifier(f"{self._table}_id_uniq"), table))
+        self.env.cr.execute(SQL(
+            "CREATE INDEX %s ON %s (date)", SQL.identifier(f"{self._table}_date_idx"), table))
+
+    @api.model
+    def _cron_refresh(self):
+        """Refresh the analysis without blocking the users reading it."""
+        self.env.flush_all()
+        self.env.cr.execute(SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY %s", SQL.identifier(self._table)))
+        self.invalidate_model()
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+from . import test_achievement_concurrency
+from . import test_benchmark
+from . import test_achievement_reversal
+from . import test_deferred_achievement
+from . import test_target_matching
+from . import test_product_targets
+from . import test_report
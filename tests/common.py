@@ -0,0 +1,245 @@
+import logging
+import os
+import time
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import fields, Command
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+_logger = logging.getLogger(__name__)
+
+
+class SalesTargetFlowCommon(AccountTestInvoicingCommon):
+    """One open salesperson target per target point in the current month,
+    and helpers creating the documents that feed them."""
+
+    TARGET_POINTS = ('so_confirm', 'invoice_validation', 'invoice_paid')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.today = fields.Date.today()
+        start = cls.today.replace(day=1)
+        cls.targets = {
+            point: cls.env['sales.target'].create({
+                'salesperson_id': cls.env.user.id,
+                'company_id': cls.company_data['company'].id,
+                'currency_id': cls.company_data['currency'].id,
+                'start_date': start,
+                'end_date': start + relativedelta(months=1, days=-1),
+                'target_point': point,
+                'target_amount': 10000.0,
+                'state': 'open',
+            })
+            for point in cls.TARGET_POINTS
+        }
+
+    def _create_order(self, amount, date_order=None):
+        return self.env['sale.order'].create({
+            'partner_id': self.partner_a.id,
+            'user_id': self.env.user.id,
+            'date_order': date_order or self.today,
+            'order_line': [Command.create({
+                'product_id': self.product_a.id, 'product_uom_qty': 1, 'price_unit': amount,
+                'tax_id': [Command.clear()],
+            })],
+        })
+
+    def _create_invoice(self, amount, move_type='out_invoice'):
+        return self.env['account.move'].create({
+            'move_type': move_type,
+            'partner_id': self.partner_a.id,
+            'invoice_user_id': self.env.user.id,
+            'invoice_date': self.today,
+            'invoice_line_ids': [Command.create({
+                'product_id': self.product_a.id, 'quantity': 1, 'price_unit': amount,
+                'tax_ids': [Command.clear()],
+            })],
+        })
+
+    def _pay(self, invoice):
+        """Pay ``invoice`` with a miscellaneous entry, reconciled on the receivable."""
+        receivable = invoice.line_ids.filtered(lambda line: line.account_id.account_type == 'asset_receivable')
+        payment = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': self.today,
+            'journal_id': self.company_data['default_journal_misc'].id,
+            'line_ids': [
+                Command.create({
+                    'account_id': receivable.account_id.id, 'partner_id': invoice.partner_id.id,
+                    'credit': invoice.amount_total,
+                }),
+                Command.create({
+                    'account_id': self.company_data['default_journal_bank'].default_account_id.id,
+                    'debit': invoice.amount_total,
+                }),
+            ],
+        })
+        payment.action_post()
+        (receivable + payment.line_ids.filtered(lambda line: line.account_id == receivable.account_id)).reconcile()
+        return receivable
+
+    def assertAchievements(self, so_confirm=0.0, invoice_validation=0.0, invoice_paid=0.0):
+        self.env.flush_all()
+        expected = {
+            'so_confirm': so_confirm,
+            'invoice_validation': invoice_validation,
+            'invoice_paid': invoice_paid,
+        }
+        for point, target in self.targets.items():
+            target.invalidate_recordset()
+            self.assertAlmostEqual(target.achievement_amount, expected[point], msg=point)
+
+
+class SalesTargetBenchmarkCommon(AccountTestInvoicingCommon):
+    """Synthetic load for the target hooks and views.
+
+    Volume scales with the ``SALES_TARGET_BENCH_SCALE`` environment variable
+    so the same suite runs quickly in CI and realistically on a bench host.
+    """
+
+    SCALE = int(os.environ.get('SALES_TARGET_BENCH_SCALE', 1))
+    COMPANIES = 2
+    TEAMS_PER_COMPANY = 2
+    SALESPEOPLE_PER_TEAM = 3
+    PERIODS = 3
+    DOCUMENTS_PER_SALESPERSON = 10
+    TARGET_POINTS = ('so_confirm', 'invoice_validation', 'invoice_paid')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bench_results = []
+        cls._generate_benchmark_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        for name, documents, queries, elapsed in cls.bench_results:
+            _logger.info(
+                "sales_target benchmark %-28s %6d docs %6d queries %8.3fs",
+                name, documents, queries, elapsed,
+            )
+        super().tearDownClass()
+
+    # ------------------------------------------------------------
+    # Data generator
+    # ------------------------------------------------------------
+    @classmethod
+    def _generate_benchmark_data(cls):
+        today = fields.Date.today()
+        first_start = today.replace(day=1) - relativedelta(months=cls.PERIODS - 1)
+        cls.periods = [
+            (first_start + relativedelta(months=index),
+             first_start + relativedelta(months=index + 1) - timedelta(days=1))
+            for index in range(cls.PERIODS)
+        ]
+        salesman_group = cls.env.ref('sales_team.group_sale_salesman')
+
+        companies_data = [cls.company_data] + [
+            cls.setup_other_company(name=f"Bench Company {index}")
+            for index in range(1, cls.COMPANIES)
+        ]
+        companies = cls.env['res.company'].union(*(data['company'] for data in companies_data))
+        cls.env.user.company_ids |= companies
+        cls.env = cls.env(context=dict(cls.env.context, allowed_company_ids=companies.ids))
+
+        cls.salespeople = cls.env['res.users']
+        cls.teams = cls.env['crm.team']
+        person_vals, team_vals, order_vals, invoice_vals = [], [], [], []
+        for company_data in companies_data:
+            company = company_data['company']
+            for team_index in range(cls.TEAMS_PER_COMPANY):
+                users = cls.env['res.users'].create([{
+                    'name': f"Bench {company.id}-{team_index}-{index}",
+                    'login': f"bench_{company.id}_{team_index}_{index}",
+                    'company_id': company.id,
+                    'company_ids': [Command.set(company.ids)],
+                    'groups_id': [Command.set(salesman_group.ids)],
+                } for index in range(cls.SALESPEOPLE_PER_TEAM)])
+                team = cls.env['crm.team'].create({
+                    'name': f"Bench Team {company.id}-{team_index}",
+                    'company_id': company.id,
+                    'member_ids': [Command.set(users.ids)],
+                })
+                cls.salespeople |= users
+                cls.teams |= team
+                for start, end in cls.periods:
+                    for point in cls.TARGET_POINTS:
+                        team_vals.append({
+                            'team_id': team.id, 'user_id': users[0].id, 'company_id': company.id,
+                            'currency_id': company.currency_id.id, 'start_date': start, 'end_date': end,
+                            'target_point': point, 'target': 100000.0, 'state': 'open',
+                        })
+                        person_vals += [{
+                            'salesperson_id': user.id, 'company_id': company.id,
+                            'currency_id': company.currency_id.id, 'start_date': start, 'end_date': end,
+                            'target_point': point, 'target_amount': 30000.0, 'state': 'open',
+                        } for user in users]
+                for user in users:
+                    for index in range(cls.DOCUMENTS_PER_SALESPERSON * cls.SCALE):
+                        start, end = cls.periods[index % cls.PERIODS]
+                        document_date = start + timedelta(days=index % (end - start).days)
+                        order_vals.append({
+                            'partner_id': cls.partner_a.id, 'user_id': user.id, 'team_id': team.id,
+                            'company_id': company.id, 'date_order': document_date,
+                            'order_line': [Command.create({
+                                'product_id': cls.product_a.id, 'product_uom_qty': 1, 'price_unit': 100.0 + index,
+                            })],
+                        })
+                        invoice_vals.append({
+                            'move_type': 'out_invoice', 'partner_id': cls.partner_a.id,
+                            'invoice_user_id': user.id, 'team_id': team.id,
+                            'journal_id': company_data['default_journal_sale'].id,
+                            'invoice_date': document_date,
+                            'invoice_line_ids': [Command.create({
+                                'product_id': cls.product_a.id, 'quantity': 1, 'price_unit': 100.0 + index,
+                                'tax_ids': [Command.clear()],
+                            })],
+                        })
+        cls.person_targets = cls.env['sales.target'].create(person_vals)
+        cls.team_targets = cls.env['sales.team.target'].create(team_vals)
+        cls.orders = cls.env['sale.order'].create(order_vals)
+        cls.invoices = cls.env['account.move'].create(invoice_vals)
+
+    # ------------------------------------------------------------
+    # Measurement
+    # ------------------------------------------------------------
+    def _benchmark(self, name, func, max_queries=None, documents=0):
+        """Run ``func`` once, record its time and query count, and fail
+        when the query count goes over ``max_queries``, if given."""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        started = time.perf_counter()
+        func()
+        self.env.flush_all()
+        elapsed = time.perf_counter() - started
+        queries = self.env.cr.sql_log_count - queries_before
+        self.bench_results.append((name, documents, queries, elapsed))
+        if max_queries is not None:
+            self.assertLessEqual(
+                queries, max_queries,
+                "%s ran %d queries for %d documents (threshold %d)" % (name, queries, documents, max_queries),
+            )
+        return queries
+
+    def _benchmark_growth(self, name, func, small, large, max_growth):
+        """Run ``func`` on ``small`` then on ``large`` and fail when the
+        second run needs more than ``max_growth`` extra queries.
+
+        Both sets should touch the same targets: the difference is then
+        what every extra document costs, whatever the fixed cost of the
+        flow, so an N+1 query shows up even on the CI scale. ``small`` and
+        ``large`` are recordsets, or sizes passed as they are to ``func``.
+        """
+        small_size, large_size = (arg if isinstance(arg, int) else len(arg) for arg in (small, large))
+        small_queries = self._benchmark(f'{name} (small)', lambda: func(small), documents=small_size)
+        large_queries = self._benchmark(f'{name} (large)', lambda: func(large), documents=large_size)
+        self.assertLessEqual(
+            large_queries - small_queries, max_growth,
+            "%s ran %d queries for %d documents and %d for %d (allowed growth %d)" % (
+                name, small_queries, small_size, large_queries, large_size, max_growth),
+        )
+        return small_queries, large_queries
@@ -0,0 +1,81 @@
+import threading
+from datetime import date
+
+from odoo import api, SUPERUSER_ID
+from odoo.sql_db import db_connect
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestAchievementConcurrency(TransactionCase):
+    """Concurrent confirmers, each on its own committed cursor, must never
+    lose an achievement increment nor deadlock on shared targets."""
+
+    WORKERS = 8
+    ROUNDS = 5
+    DELTA = 100.0
+    TARGET = 10000.0
+
+    def setUp(self):
+        super().setUp()
+        # The test transaction is never committed, so the shared data is
+        # created and removed through separate cursors.
+        self.connection = db_connect(self.env.cr.dbname)
+        with self.connection.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            team = env['crm.team'].create({'name': "Concurrency Test Team"})
+            targets = env['sales.team.target'].create([{
+                'team_id': team.id,
+                'user_id': SUPERUSER_ID,
+                'start_date': date(2000, 1, 1),
+                'end_date': date(2000, 12, 31),
+                'target_point': target_point,
+                'target': self.TARGET,
+                'state': 'open',
+            } for target_point in ('so_confirm', 'invoice_validation')])
+            env.flush_all()
+            self.team_id = team.id
+            self.target_ids = targets.ids
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        with self.connection.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env['sales.team.target'].browse(self.target_ids).unlink()
+            env['crm.team'].browse(self.team_id).unlink()
+            env.flush_all()
+
+    def _confirmer(self, target_ids, barrier, errors):
+        try:
+            barrier.wait()
+            for __ in range(self.ROUNDS):
+                with self.connection.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    env['sales.team.target']._add_achievement(
+                        dict.fromkeys(target_ids, self.DELTA))
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    def test_no_lost_updates(self):
+        errors = []
+        barrier = threading.Barrier(self.WORKERS)
+        # Half of the workers pass the targets in reverse order: the lock
+        # order must not depend on the caller.
+        threads = [
+            threading.Thread(target=self._confirmer, args=(
+                self.target_ids if index % 2 else self.target_ids[::-1], barrier, errors))
+            for index in range(self.WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(errors, "Concurrent confirmers failed: %s" % errors)
+
+        expected = self.WORKERS * self.ROUNDS * self.DELTA
+        with self.connection.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            for target in env['sales.team.target'].browse(self.target_ids):
+                self.assertAlmostEqual(target.achievement, expected)
+                self.assertAlmostEqual(target.difference, expected - self.TARGET)
+                self.assertAlmostEqual(target.achievement_percentage, expected / self.TARGET * 100)
@@ -0,0 +1,58 @@
+from odoo.tests import tagged
+
+from .common import SalesTargetFlowCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAchievementReversal(SalesTargetFlowCommon):
+    """Achievements follow documents going back: unpaid, cancelled,
+    refunded or reset to draft."""
+
+    def test_pay_then_unreconcile(self):
+        invoice = self._create_invoice(1000.0)
+        invoice.action_post()
+        receivable = self._pay(invoice)
+        self.assertEqual(invoice.payment_state, 'paid')
+        # A paid invoice stays validated
+        self.assertAchievements(invoice_validation=1000.0, invoice_paid=1000.0)
+
+        receivable.remove_move_reconcile()
+        self.assertNotEqual(invoice.payment_state, 'paid')
+        self.assertAchievements(invoice_validation=1000.0)
+
+        # The recompute agrees with the incremental updates
+        targets = self.env['sales.target'].union(*self.targets.values())
+        targets._recompute_achievement()
+        self.assertFalse(targets.achievement_line_ids.filtered(lambda line: line.event == 'adjustment'))
+        self.assertAchievements(invoice_validation=1000.0)
+
+    def test_cancel_and_confirm_order_again(self):
+        order = self._create_order(500.0)
+        order.action_confirm()
+        self.assertAchievements(so_confirm=500.0)
+
+        order._action_cancel()
+        self.assertAchievements()
+
+        order.action_draft()
+        order.action_confirm()
+        self.assertAchievements(so_confirm=500.0)
+        live = self.targets['so_confirm'].achievement_line_ids.filtered(
+            lambda line: line.event == 'so_confirm' and not line.reversed)
+        self.assertEqual(len(live), 1)
+
+    def test_credit_note(self):
+        self._create_invoice(1000.0).action_post()
+        self._create_invoice(300.0, 'out_refund').action_post()
+        self.assertAchievements(invoice_validation=700.0)
+
+    def test_reset_to_draft(self):
+        invoice = self._create_invoice(1000.0)
+        invoice.action_post()
+        self.assertAchievements(invoice_validation=1000.0)
+
+        invoice.button_draft()
+        self.assertAchievements()
+
+        invoice.action_post()
+        self.assertAchievements(invoice_validation=1000.0)
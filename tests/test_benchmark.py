@@ -0,0 +1,111 @@
+from odoo.tests import tagged
+
+from .common import SalesTargetBenchmarkCommon
+
+# Query growth allowed when a scenario runs on every document instead of
+# one document per target, the targets touched being the same.
+# "_hooks" scenarios only run this module's batched code: they read, lock
+# and update each target model once whatever the number of documents, so
+# they may not grow at all, but for the split of the ledger inserts.
+HOOKS_GROWTH = 2
+# The web client reads a page of targets in one batch: a bigger page may
+# not need more queries.
+LIST_VIEW_GROWTH = 2
+# Full scenarios include the core flows, which are linear: extra queries
+# per extra document. To be kept in line with a bench run of the core
+# flows without this module.
+QUERIES_PER_DOCUMENT = {
+    'confirm': 80,
+    'post': 80,
+}
+
+
+@tagged('post_install', '-at_install', 'sales_target_benchmark')
+class TestSalesTargetBenchmark(SalesTargetBenchmarkCommon):
+
+    def _split_per_target(self, documents, point_type):
+        """Split ``documents`` into one document per salesperson target and
+        the others; team targets follow, each team holding whole salespeople."""
+        matches = self.env['sales.target'].sudo()._find_open_targets(documents, point_type)
+        first_ids = {}
+        for document_id, target in matches.items():
+            first_ids.setdefault(target.id, document_id)
+        small = documents.browse(sorted(first_ids.values()))
+        return small, documents - small
+
+    def _clear_ledger(self):
+        self.env['sales.target.achievement.line'].search([]).unlink()
+
+    def test_sale_order_confirm(self):
+        small, others = self._split_per_target(self.orders, 'so_confirm')
+        self._benchmark_growth(
+            'sale.order.action_confirm', lambda orders: orders.action_confirm(), small, others,
+            QUERIES_PER_DOCUMENT['confirm'] * (len(others) - len(small)),
+        )
+
+        self._clear_ledger()
+
+        def run_hooks(orders):
+            for model, field in (('sales.target', 'sales_target_id'), ('sales.team.target', 'sales_team_target_id')):
+                targets = self.env[model].sudo()
+                matches = targets._find_open_targets(orders, 'so_confirm')
+                targets._link_documents(orders, field, matches)
+                targets._update_achievement(orders, 'so_confirm', matches=matches)
+        self._benchmark_growth('confirm hooks', run_hooks, small, self.orders, HOOKS_GROWTH)
+
+    def test_account_move_post_and_reconcile(self):
+        small, others = self._split_per_target(self.invoices, 'invoice_validation')
+        self._benchmark_growth(
+            'account.move.action_post', lambda invoices: invoices.action_post(), small, others,
+            QUERIES_PER_DOCUMENT['post'] * (len(others) - len(small)),
+        )
+
+        self._clear_ledger()
+
+        def run_hooks(invoices):
+            invoices._assign_sales_target()
+            invoices._assign_sales_team_target()
+            self.env['sales.target'].sudo()._update_achievement(invoices, 'invoice_validation')
+        self._benchmark_growth('post hooks', run_hooks, small, self.invoices, HOOKS_GROWTH)
+
+        self._benchmark_growth(
+            'paid hooks', lambda invoices: invoices._record_sales_target_payment(),
+            small, self.invoices, HOOKS_GROWTH,
+        )
+
+    def _list_specification(self, model_name, field_names):
+        model = self.env[model_name]
+        specification = {}
+        for name in field_names:
+            field = model._fields[name]
+            if field.type == 'many2one':
+                specification[name] = {'fields': {'display_name': {}}}
+            elif field.type in ('one2many', 'many2many'):
+                specification[name] = {'fields': {}}
+            else:
+                specification[name] = {}
+        return specification
+
+    def test_list_views(self):
+        views = {
+            'sales.target': [
+                'name', 'salesperson_id', 'start_date', 'end_date', 'target_point', 'target_amount',
+                'achievement_amount', 'difference_amount', 'achievement_percent', 'state',
+                'sale_total', 'invoice_total', 'order_ids', 'invoice_ids', 'order_count', 'invoice_count',
+                'theoretical_amount', 'theoretical_percent', 'theoretical_status',
+            ],
+            'sales.team.target': [
+                'name', 'team_id', 'user_id', 'target_point', 'target', 'achievement',
+                'achievement_percentage', 'state', 'company_id', 'difference',
+                'sale_total', 'invoice_total', 'order_ids', 'invoice_ids', 'order_count', 'invoice_count',
+                'theoretical_achievement', 'theoretical_percentage', 'theoretical_status',
+            ],
+        }
+        for model_name, field_names in views.items():
+            model = self.env[model_name]
+            specification = self._list_specification(model_name, field_names)
+            self._benchmark_growth(
+                f'{model_name} web_search_read',
+                lambda limit: model.web_search_read([], specification, limit=limit),
+                8, 80, LIST_VIEW_GROWTH,
+            )
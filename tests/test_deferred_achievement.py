@@ -0,0 +1,27 @@
+from odoo.tests import tagged
+
+from odoo.addons.sales_target_omax.models.sales_target_mixin import DEFERRED_PARAM
+
+from .common import SalesTargetFlowCommon
+
+
+@tagged('post_install', '-at_install')
+class TestDeferredAchievement(SalesTargetFlowCommon):
+    """In deferred mode events are only queued in the ledger; the queue
+    cron applies each of them exactly once."""
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param(DEFERRED_PARAM, '1')
+
+    def test_edit_target_before_cron(self):
+        self._create_order(500.0).action_confirm()
+        self.assertAchievements()
+
+        # Recomputing the stored achievement must not count the queued rows
+        self.targets['so_confirm'].target_amount = 20000.0
+        self.assertAchievements()
+
+        self.env['sales.target.achievement.line']._cron_apply_pending()
+        self.assertAchievements(so_confirm=500.0)
+        self.assertAlmostEqual(self.targets['so_confirm'].achievement_percent, 2.5)
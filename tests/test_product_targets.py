@@ -0,0 +1,58 @@
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import SalesTargetFlowCommon
+
+
+@tagged('post_install', '-at_install')
+class TestProductTargets(SalesTargetFlowCommon):
+    """Product targets read the line facts; team targets rolled up from
+    their members read them through the member targets only."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        start = cls.today.replace(day=1)
+        period = {
+            'company_id': cls.company_data['company'].id,
+            'currency_id': cls.company_data['currency'].id,
+            'start_date': start,
+            'end_date': start + relativedelta(months=1, days=-1),
+            'target_point': 'so_confirm',
+            'dimension': 'product',
+            'product_id': cls.product_a.id,
+            'state': 'open',
+        }
+        cls.team = cls.env['crm.team'].create({
+            'name': "Rollup Team",
+            'company_id': cls.company_data['company'].id,
+            'member_ids': [Command.set(cls.env.user.ids)],
+        })
+        cls.product_target = cls.env['sales.target'].create({
+            **period, 'salesperson_id': cls.env.user.id, 'target_amount': 10000.0,
+        })
+        cls.team_product_target = cls.env['sales.team.target'].create({
+            **period, 'team_id': cls.team.id, 'user_id': cls.env.user.id, 'target': 10000.0,
+            'achievement_source': 'members',
+        })
+
+    def assertProductAchievements(self, amount):
+        self.env.flush_all()
+        self.env.invalidate_all()
+        self.assertAlmostEqual(self.product_target.achievement_amount, amount)
+        self.assertAlmostEqual(self.team_product_target.achievement, amount)
+
+    def test_rollup_counts_order_once(self):
+        order = self._create_order(500.0)
+        order.team_id = self.team
+        order.action_confirm()
+        # Through the member target, not the team's facts a second time
+        self.assertProductAchievements(500.0)
+
+        # The rebuilds agree with the incremental updates
+        self.env['sales.target.fact']._rebuild()
+        self.assertProductAchievements(500.0)
+        self.team_product_target._recompute_achievement()
+        self.assertProductAchievements(500.0)
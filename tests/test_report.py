@@ -0,0 +1,46 @@
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command
+from odoo.tests import tagged
+from odoo.tools import SQL
+
+from .common import SalesTargetFlowCommon
+
+
+@tagged('post_install', '-at_install')
+class TestSalesTargetReport(SalesTargetFlowCommon):
+
+    def test_row_ids_unique(self):
+        # Team targets take ids of their own table, the same as salesperson targets'
+        team = self.env['crm.team'].create({
+            'name': "Report Team",
+            'company_id': self.company_data['company'].id,
+            'member_ids': [Command.set(self.env.user.ids)],
+        })
+        start = self.today.replace(day=1)
+        self.env['sales.team.target'].create([{
+            'team_id': team.id,
+            'user_id': self.env.user.id,
+            'company_id': self.company_data['company'].id,
+            'currency_id': self.company_data['currency'].id,
+            'start_date': start,
+            'end_date': start + relativedelta(months=1, days=-1),
+            'target_point': point,
+            'target': 10000.0,
+            'state': 'open',
+        } for point in self.TARGET_POINTS])
+        self.env.flush_all()
+
+        report = self.env['sales.target.report']
+        self.env.cr.execute(SQL(
+            "SELECT COUNT(*), COUNT(DISTINCT id), MIN(id), COUNT(sales_team_target_id) FROM (%s) r",
+            report._query(),
+        ))
+        count, distinct, min_id, team_rows = self.env.cr.fetchone()
+        self.assertTrue(team_rows)
+        self.assertEqual(count, distinct)
+        self.assertGreater(min_id, 0)
+
+        # The materialized view refreshes concurrently on its unique id
+        report._cron_refresh()
+        self.assertEqual(report.search_count([]), count)
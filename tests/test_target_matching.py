@@ -0,0 +1,35 @@
+from dateutil.relativedelta import relativedelta
+
+from odoo.tests import tagged
+
+from .common import SalesTargetFlowCommon
+
+
+@tagged('post_install', '-at_install')
+class TestTargetMatching(SalesTargetFlowCommon):
+    """Documents go to the target covering the date that makes them count."""
+
+    def test_confirm_across_period_boundary(self):
+        start = self.today.replace(day=1)
+        current = self.targets['so_confirm']
+        previous = self.env['sales.target'].create({
+            'salesperson_id': self.env.user.id,
+            'company_id': current.company_id.id,
+            'currency_id': current.currency_id.id,
+            'start_date': start - relativedelta(months=1),
+            'end_date': start - relativedelta(days=1),
+            'target_point': 'so_confirm',
+            'target_amount': 10000.0,
+            'state': 'open',
+        })
+        # A quotation made on the last day of the previous period...
+        order = self._create_order(500.0, date_order=start - relativedelta(days=1))
+        self.assertEqual(order.sales_target_id, previous)
+
+        # ...counts in the period it is confirmed in: confirming resets date_order
+        order.action_confirm()
+        self.assertEqual(order.date_order.date(), self.today)
+        self.assertEqual(order.sales_target_id, current)
+        self.assertAchievements(so_confirm=500.0)
+        previous.invalidate_recordset()
+        self.assertFalse(previous.achievement_amount)
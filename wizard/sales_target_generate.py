@@ -0,0 +1,152 @@
+import base64
+import csv
+import io
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+
+class SalesTargetGenerate(models.TransientModel):
+    _name = "sales.target.generate"
+    _description = "Generate Sales Targets"
+
+    target_model = fields.Selection([
+        ('sales.target', 'Salesperson Targets'),
+        ('sales.team.target', 'Sales Team Targets'),
+    ], string="Generate", required=True, default='sales.target')
+    mode = fields.Selection([
+        ('copy', 'Copy Previous Period'),
+        ('csv', 'Import CSV'),
+    ], string="Source", required=True, default='copy')
+    company_id = fields.Many2one('res.company', string="Company", required=True,
+                                 default=lambda self: self.env.company)
+
+    start_date = fields.Date(string="Start Date", required=True,
+                             default=lambda self: fields.Date.context_today(self).replace(day=1) + relativedelta(months=1))
+    end_date = fields.Date(string="End Date", required=True,
+                           default=lambda self: fields.Date.context_today(self).replace(day=1) + relativedelta(months=2, days=-1))
+
+    # Copy
+    source_start_date = fields.Date(string="Copy From", compute="_compute_source_period", store=True, readonly=False)
+    source_end_date = fields.Date(string="Copy To", compute="_compute_source_period", store=True, readonly=False)
+    growth_percent = fields.Float(string="Growth (%)", help="Applied to the target amounts copied.")
+
+    # CSV
+    csv_file = fields.Binary(string="CSV File")
+    csv_filename = fields.Char(string="File Name")
+    target_point = fields.Selection([
+        ('so_confirm', 'Sale Order Confirm'),
+        ('invoice_validation', 'Invoice Validation'),
+        ('invoice_paid', 'Invoice Paid'),
+    ], string="Default Target Point", default='so_confirm',
+        help="Used for the CSV rows without a target_point column.")
+
+    confirm = fields.Boolean(string="Confirm Targets", help="Open the generated targets right away.")
+
+    @api.depends('start_date', 'end_date')
+    def _compute_source_period(self):
+        """Previous period of the same length, in whole months when possible."""
+        for wizard in self:
+            if not (wizard.start_date and wizard.end_date):
+                wizard.source_start_date = wizard.source_end_date = False
+                continue
+            length = relativedelta(wizard.end_date + relativedelta(days=1), wizard.start_date)
+            if wizard.start_date.day == 1 and not length.days:
+                wizard.source_start_date = wizard.start_date - relativedelta(years=length.years, months=length.months)
+            else:
+                wizard.source_start_date = wizard.start_date - (wizard.end_date - wizard.start_date) - relativedelta(days=1)
+            wizard.source_end_date = wizard.start_date - relativedelta(days=1)
+
+    def _get_copy_vals(self):
+        """One target per target of the previous period, grown by ``growth_percent``."""
+        targets = self.env[self.target_model]
+        sources = targets.search([
+            ('state', '!=', 'draft'),
+            ('company_id', 'in', [self.company_id.id, False]),
+            ('start_date', '>=', self.source_start_date),
+            ('end_date', '<=', self.source_end_date),
+        ], order='id')
+        if not sources:
+            raise UserError("No confirmed target found between %s and %s." % (
+                self.source_start_date, self.source_end_date))
+        factor = 1 + self.growth_percent / 100
+        return [
+            targets._prepare_generated_vals(
+                source[targets._target_owner_field], source.target_point,
+                source.currency_id.round(source[targets._target_amount_field] * factor),
+                self.start_date, self.end_date, self.company_id, source=source,
+            )
+            for source in sources
+        ]
+
+    def _get_csv_vals(self):
+        """One target per CSV row.
+
+        Columns: ``owner`` (salesperson login or sales team name, or their
+        id), ``target`` (amount) and optionally ``target_point``. Owners are
+        resolved with one search for the whole file.
+        """
+        if not self.csv_file:
+            raise UserError("Please upload a CSV file.")
+        targets = self.env[self.target_model]
+        try:
+            rows = list(csv.DictReader(io.StringIO(base64.b64decode(self.csv_file).decode('utf-8-sig'))))
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise UserError("Could not read the CSV file: %s" % e)
+        if not rows:
+            raise UserError("The CSV file has no rows.")
+        if not {'owner', 'target'} <= set(rows[0]):
+            raise UserError("The CSV file needs an 'owner' and a 'target' column.")
+
+        owner_model = targets[targets._target_owner_field]
+        key_field = 'login' if owner_model._name == 'res.users' else 'name'
+        keys = {row['owner'].strip() for row in rows}
+        owners = owner_model.search(['|',
+            ('id', 'in', [int(key) for key in keys if key.isdigit()]),
+            (key_field, 'in', list(keys)),
+        ])
+        owner_by_key = {str(owner.id): owner for owner in owners}
+        owner_by_key.update((owner[key_field], owner) for owner in owners)
+
+        vals_list = []
+        points = dict(self._fields['target_point'].selection)
+        for line, row in enumerate(rows, start=2):
+            owner = owner_by_key.get(row['owner'].strip())
+            if not owner:
+                raise UserError("Line %s: unknown owner %r." % (line, row['owner']))
+            target_point = (row.get('target_point') or '').strip() or self.target_point
+            if target_point not in points:
+                raise UserError("Line %s: unknown target point %r." % (line, target_point))
+            try:
+                amount = float(row['target'])
+            except ValueError:
+                raise UserError("Line %s: invalid target amount %r." % (line, row['target']))
+            vals = targets._prepare_generated_vals(
+                owner, target_point, amount, self.start_date, self.end_date, self.company_id,
+            )
+            if 'user_id' in vals and not vals['user_id']:
+                raise UserError("Line %s: sales team %r has no team leader to be responsible for its target."
+                                % (line, owner.display_name))
+            vals_list.append(vals)
+        return vals_list
+
+    def action_generate(self):
+        self.ensure_one()
+        if self.start_date > self.end_date:
+            raise UserError("The start date must be before the end date.")
+        vals_list = self._get_copy_vals() if self.mode == 'copy' else self._get_csv_vals()
+        targets_model = self.env[self.target_model].with_context(tracking_disable=True)
+        targets_model._check_period_overlaps(vals_list)
+        # One batched create; team references come from one sequence reservation
+        targets = targets_model.create(vals_list)
+        if self.confirm:
+            targets.action_confirm()
+        return {
+            'name': "Generated Targets",
+            'type': 'ir.actions.act_window',
+            'res_model': self.target_model,
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', targets.ids)],
+        }